@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 
 from bot.bot import run_bot
 
-load_dotenv()
+# image workers are spawned processes which import this module too
+if __name__ == "__main__":
+    load_dotenv()
 
-asyncio.run(run_bot())
+    asyncio.run(run_bot())
@@ -2,19 +2,31 @@ import asyncio
 import datetime as dt
 import json
 import logging
+import multiprocessing
 import sys
+import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 from pathlib import Path
 
 import aiohttp
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.utils import get
 from motor import motor_asyncio
 
-from bot.constants import Bot, Database
-from bot.exceptions import SnippetDoesNotExist, SnippetExists
+from bot.cogs.utils.cooldowns import CooldownRegistry
+from bot.cogs.utils.dispatch import MessageDispatcher
+from bot.cogs.utils.icons import IconService
+from bot.cogs.utils.modlog import ModLog
+from bot.constants import Bot, Cooldowns, Database, Icons, Images, ModLogConfig
+from bot.exceptions import (
+    CompletionFailed,
+    CompletionQueueFull,
+    SnippetDoesNotExist,
+    SnippetExists,
+)
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -85,16 +97,32 @@ async def run_bot():
     try:
 
         async with bot:
-            for n, ext in enumerate(bot_extensions):
-                await bot.load_extension(f"bot.{ext}")
-                print(f"{n + 1}. Loaded extension: [{ext}]")
-
             # pool = await asyncpg.create_pool(Database.pgsql_string)
+            # cogs may read their state in cog_load, connect first
             db = motor_asyncio.AsyncIOMotorClient(Database.mongodb_string)
             bot.snippets = db.snippetsdb.snippets
             bot.custom_roles = db.snippetsdb.custom_roles
+            bot.cooldown_buckets = db.snippetsdb.cooldown_buckets
+            bot.mod_actions = db.snippetsdb.mod_actions
+            bot.telemetry = db.snippetsdb.telemetry
+            bot.verification_deadlines = db.snippetsdb.verification_deadlines
+            bot.verification_queue = db.snippetsdb.verification_queue
+            bot.live_messages = db.snippetsdb.live_messages
+            bot.ai_usage = db.snippetsdb.ai_usage
 
             bot.session = aiohttp.ClientSession(json_serialize=json.dumps)
+            bot.icons = IconService(
+                bot,
+                max_download=Icons.max_download,
+                size=Icons.size,
+                timeout=Icons.timeout,
+                cache_size=Icons.cache_size,
+                cache_ttl=Icons.cache_ttl,
+            )
+
+            for n, ext in enumerate(bot_extensions):
+                await bot.load_extension(f"bot.{ext}")
+                print(f"{n + 1}. Loaded extension: [{ext}]")
 
             await bot.start(Bot.token, reconnect=True)
 
@@ -108,6 +136,76 @@ class ChillBot(commands.Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.start_time = dt.datetime.now()
+        self.dispatcher = MessageDispatcher()
+        self.cooldowns = CooldownRegistry(
+            capacity=Cooldowns.capacity,
+            resolution=Cooldowns.sweep_interval,
+            slots=Cooldowns.wheel_slots,
+        )
+        # needs the database, created in setup_hook
+        self.modlog = None
+        # for image work, spawned rather than forked since motor runs threads
+        self.process_pool = ProcessPoolExecutor(
+            max_workers=Images.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    async def setup_hook(self):
+        if Cooldowns.snapshot:
+            await self.cooldowns.load(self.cooldown_buckets)
+            self.save_cooldowns.change_interval(seconds=Cooldowns.snapshot_interval)
+            self.save_cooldowns.start()
+
+        self.cooldowns.sweeper.start()
+
+        self.modlog = ModLog(
+            self.mod_actions,
+            batch_size=ModLogConfig.batch_size,
+            flush_interval=ModLogConfig.flush_interval,
+            max_pending=ModLogConfig.max_pending,
+            retention_days=ModLogConfig.retention_days,
+        )
+        await self.modlog.ensure_indexes()
+        self.modlog.flusher.start()
+
+    async def close(self):
+        self.cooldowns.sweeper.cancel()
+        if self.modlog is not None:
+            await self.modlog.close()
+
+        if self.save_cooldowns.is_running():
+            self.save_cooldowns.cancel()
+            try:
+                await self.cooldowns.save(self.cooldown_buckets)
+            except Exception as e:
+                print("Failed to save cooldowns:", e, file=sys.stderr)
+
+        self.process_pool.shutdown(wait=False, cancel_futures=True)
+        await super().close()
+
+    async def run_in_process(self, func, *args):
+        """Run a CPU heavy ``func(*args)`` in the process pool.
+
+        ``func`` and its arguments have to be picklable, i.e. module level
+        functions and plain data.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.process_pool, func, *args)
+
+    @tasks.loop(minutes=5)
+    async def save_cooldowns(self):
+        await self.cooldowns.save(self.cooldown_buckets)
+
+    async def on_message(self, message):
+        if message.author.bot:
+            return
+
+        # cogs register their message handlers with the dispatcher
+        await self.dispatcher.dispatch(message)
+
+        start = time.perf_counter_ns()
+        await self.process_commands(message)
+        self.dispatcher.record("commands", time.perf_counter_ns() - start)
 
     # async def on_error(self, event_method, *args, **kwargs):
     #     print(f"An error occurred while running {event_method}.")
@@ -146,6 +244,20 @@ class ChillBot(commands.Bot):
         elif isinstance(exception, commands.DisabledCommand):
             await ctx.author.send("Sorry. This command is disabled and cannot be used.")
 
+        # a CommandError raised in a command isn't wrapped in CommandInvokeError
+        elif isinstance(exception, CompletionQueueFull):
+            await ctx.send(
+                "Too many requests are waiting already, try again in a minute.",
+                reference=ctx.message,
+            )
+
+        elif isinstance(exception, CompletionFailed):
+            print(exception, file=sys.stderr)
+            await ctx.send(
+                "Couldn't get a response right now, try again later.",
+                reference=ctx.message,
+            )
+
         elif isinstance(exception, commands.CommandInvokeError):
             original = exception.original
             if not isinstance(original, discord.HTTPException):
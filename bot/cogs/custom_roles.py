@@ -1,16 +1,19 @@
-import asyncio
 import io
 import json
+import logging
 import re
-from typing import List, Literal, Optional, Union
+from typing import Any, Dict, List, Literal, Optional, Union
 
-import aiohttp
 import discord
 from discord import app_commands, Interaction
 from discord.ext import commands
 from discord.ext.commands import Context, Greedy
 
+from bot.cogs.utils.queues import WorkQueue
+from bot.cogs.utils.role_index import ROLE_LIMIT, RoleNameIndex
+from bot.cogs.utils.role_store import CustomRoleStore
 from bot.constants import Guilds, People, Roles
+from bot.exceptions import IconUnavailable
 
 # # MONGO SCHEMA
 # {
@@ -23,7 +26,11 @@ from bot.constants import Guilds, People, Roles
 # }
 
 
+log = logging.getLogger(__name__)
+
 MIN_LVL = 40
+# custom roles go this many positions below the bot's top role
+ROLE_POSITION_OFFSET = 25
 HEX_PATTERN = re.compile(r"^#?([0-9a-fA-F]{6})$")
 
 
@@ -73,22 +80,18 @@ def is_patreon_t2(i: discord.Interaction):
     return False
 
 
-def check_role_name(name: str, roles: List[discord.Role]) -> str:
+def check_role_name(name: str, guild: discord.Guild, index: RoleNameIndex) -> str:
     if len(name) > 32:
         raise CustomCheckFailure("Role names must be less than 32 characters.")
-    if name.lower() in [role.name.lower() for role in roles]:
+    if index.is_taken(guild, name):
         raise CustomCheckFailure("Role name must be unique and not already in use.")
     return name
 
 
-def check_role_name_edit(
-    name: str, role: discord.Role, roles: List[discord.Role]
-) -> str:
+def check_role_name_edit(name: str, role: discord.Role, index: RoleNameIndex) -> str:
     if len(name) > 32:
         raise CustomCheckFailure("Role names must be less than 32 characters.")
-    roles = [r for r in roles if r.id != role.id]
-
-    if name.lower() in [role.name.lower() for role in roles]:
+    if index.is_taken(role.guild, name, exclude=role.id):
         raise CustomCheckFailure("Role name must be unique and not already in use.")
     return name
 
@@ -129,22 +132,33 @@ def is_valid_hex(hex_code: str):
         return False
 
 
-async def get_icon(icon_url: str, session: aiohttp.ClientSession):
-    async with session.get(icon_url) as resp:
-        return await resp.read()
-
-
-async def create_role(
-    interaction, name, color, icon_url, mentionable, bot
-) -> discord.Role:
-    """Create a role with the given name, color, and icon url"""
-    role_name = check_role_name(name, interaction.guild.roles)
+async def get_icon(icon_url: str, bot) -> bytes:
+    try:
+        return await bot.icons.get(icon_url)
+    except IconUnavailable as e:
+        raise CustomCheckFailure(str(e)) from e
+
+
+async def prepare_role(
+    interaction, name, color, icon_url, bot, index
+) -> Optional[Dict[str, Any]]:
+    """Validate the role options and fetch the icon.
+
+    Returns the arguments for ``Guild.create_role``, or None if the user was
+    told why the role can't be created.
+    """
+    fields = {
+        "name": check_role_name(name, interaction.guild, index),
+        "color": discord.Color.default(),
+        "mentionable": True,
+    }
     if color:
         role_color = is_valid_hex(color)
         if role_color is False:
             raise CustomCheckFailure(
                 "Role color must be a valid hex color e.g. #FFFFFF"
             )
+        fields["color"] = discord.Color(role_color)
     if icon_url:
         role_icon_url = check_role_icon_url(icon_url)
         # make sure it's patreon T2 or min lvl +
@@ -157,54 +171,53 @@ async def create_role(
                 f"You must be a Patreon T2 or level {MIN_LVL}+ to use custom role icons.",
                 ephemeral=True,
             )
-            return
-        # turn the role_icon_url to bytes
+            return None
+        fields["display_icon"] = await get_icon(role_icon_url, bot)
 
-        role_icon_bytes = await get_icon(role_icon_url, bot.session)
+    return fields
 
-    # create the role with the validated name, color, and icon url
 
-    if color:
-        role_color = discord.Color(role_color)
-    else:
-        role_color = discord.Color.default()  # default color
+async def create_role(
+    interaction, fields, *, color, icon_url, store, index
+) -> discord.Role:
+    """Create the role in one request, move it below the bot's top role and assign it
 
-    if icon_url:
-        try:
-            display_icon = role_icon_bytes
-        except Exception as e:
-            print("Error, couldn't decode image: ", e)
-            return
-    else:
-        display_icon = None
+    The role is deleted again if any later step fails.
+    """
+    guild = interaction.guild
+    role = await guild.create_role(
+        reason=f"Created by {interaction.user} ({interaction.user.id})", **fields
+    )
+    # the next queued role checks its name against the index, don't wait
+    # for the gateway event to add this one
+    index.add(role)
 
     try:
-        role = await interaction.guild.create_role(
-            name=role_name,
-            color=role_color,
-            reason=f"Created by {interaction.user} ({interaction.user.id})",
-            display_icon=display_icon,
-            mentionable=mentionable,
-        )
-    except Exception as e:
-        print("Error, couldn't create role: ", e)
-
-    await asyncio.sleep(2)
-
-    if role:
-        top_pos = interaction.guild.me.top_role.position
-        await role.edit(position=top_pos - 25)
+        # only the new role is sent, discord shifts the others itself, so this
+        # doesn't depend on the cached positions being current
+        top_pos = guild.me.top_role.position
+        await guild.edit_role_positions({role: top_pos - ROLE_POSITION_OFFSET})
+        await interaction.user.add_roles(role)
 
-        await bot.custom_roles.insert_one(
+        await store.insert(
             {
                 "user_id": interaction.user.id,
                 "role_id": role.id,
-                "name": name,
+                "name": fields["name"],
                 "color": color,
                 "icon_url": icon_url,
                 "mentionable": True,
             }
         )
+    except Exception:
+        # a role nobody owns would keep its name taken
+        try:
+            await role.delete(reason="Custom role creation failed")
+        except discord.HTTPException as e:
+            log.warning("Failed to delete unfinished custom role %s: %s", role.id, e)
+        else:
+            index.remove(role)
+        raise
 
     return role
 
@@ -221,7 +234,27 @@ async def is_not_blacklisted(interaction):
 class MyCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.roles_being_created = set()
+        # guild id -> queue creating that guild's roles one at a time
+        self.creation_queues: Dict[int, WorkQueue] = {}
+        self.role_names = RoleNameIndex()
+        self.store = CustomRoleStore(bot.custom_roles)
+
+    async def cog_load(self):
+        await self.store.load()
+
+    async def cog_unload(self):
+        for queue in self.creation_queues.values():
+            await queue.stop()
+
+    def creation_queue(self, guild: discord.Guild) -> WorkQueue:
+        queue = self.creation_queues.get(guild.id)
+        if queue is None:
+            # role creation isn't idempotent, failures are reported, not retried.
+            # keys are user ids and are forgotten as soon as their job is done
+            queue = self.creation_queues[guild.id] = WorkQueue(
+                f"custom_roles:{guild.id}", retries=0, remember=0
+            )
+        return queue
 
     # async def cog_check(self, ctx) -> bool:
     #     return ctx.user.id == 982097011434201108
@@ -255,36 +288,72 @@ class MyCog(commands.Cog):
 
         await interaction.response.defer()
 
-        if interaction.user.id in self.roles_being_created:
+        queue = self.creation_queue(interaction.guild)
+        if queue.is_known(interaction.user.id):
             await interaction.followup.send(
                 "You already have a role being created!", ephemeral=True
             )
             return
 
         # check if user already has a custom role
-        document = await self.bot.custom_roles.find_one(
-            {"user_id": interaction.user.id}
-        )
-        if document:
+        if self.store.get(interaction.user.id) is not None:
             await interaction.followup.send(
                 "You already have a custom role!", ephemeral=True
             )
             return
 
-        # create the role
+        fields = await prepare_role(
+            interaction, name, color, icon_url, self.bot, self.role_names
+        )
+        if fields is None:
+            return
 
-        role = await create_role(
-            interaction, name, color, icon_url, mentionable=True, bot=self.bot
+        # roles of a guild are created one after another, so their positions
+        # don't race each other
+        ahead = queue.pending
+        submitted = queue.submit(
+            interaction.user.id,
+            lambda: self.run_creation(interaction, fields, color, icon_url),
         )
+        # another invocation got in while the icon was fetched
+        if not submitted:
+            await interaction.followup.send(
+                "You already have a role being created!", ephemeral=True
+            )
+        elif ahead:
+            await interaction.followup.send(
+                f"Your role is queued at position {ahead + 1}, "
+                "you'll get a message here once it's created.",
+                ephemeral=True,
+            )
 
-        await interaction.user.add_roles(role)
+    async def run_creation(self, interaction, fields, color, icon_url):
+        try:
+            # the name may have been taken while this waited in the queue
+            check_role_name(fields["name"], interaction.guild, self.role_names)
+            role = await create_role(
+                interaction,
+                fields,
+                color=color,
+                icon_url=icon_url,
+                store=self.store,
+                index=self.role_names,
+            )
+        except CustomCheckFailure as e:
+            await interaction.followup.send(str(e), ephemeral=True)
+            return
+        except Exception as e:
+            # the queue would only log it, the user is still waiting for an answer
+            log.warning("Failed to create a role for %s: %r", interaction.user.id, e)
+            await interaction.followup.send(
+                "Couldn't create your role, try again later.", ephemeral=True
+            )
+            return
 
         await interaction.followup.send(
             f"Created and assigned role {role.mention}!", ephemeral=True
         )
 
-        self.roles_being_created.remove(interaction.user.id)
-
     @cr.command(name="update")
     @group_cooldown
     @app_commands.describe(
@@ -310,9 +379,7 @@ class MyCog(commands.Cog):
         await interaction.response.defer()
 
         # get the document with all the info
-        document = await self.bot.custom_roles.find_one(
-            {"user_id": interaction.user.id}
-        )
+        document = self.store.get(interaction.user.id)
 
         if not document:
             await interaction.followup.send(
@@ -335,7 +402,7 @@ class MyCog(commands.Cog):
 
         if name:
             # ok
-            update["name"] = check_role_name_edit(name, role, interaction.guild.roles)
+            update["name"] = check_role_name_edit(name, role, self.role_names)
 
         if color:
             _hex = is_valid_hex(color)
@@ -349,14 +416,11 @@ class MyCog(commands.Cog):
         if icon_url:
             update["icon_url"] = check_role_icon_url(icon_url)
 
-        await self.bot.custom_roles.update_one(
-            {"user_id": interaction.user.id, "role.id": role.id}, {"$set": update}
-        )
+        # stored once the role has them, a failed icon or edit changes nothing
+        stored = dict(update)
 
         if "icon_url" in update:
-            update["display_icon"] = await get_icon(
-                update.pop("icon_url"), self.bot.session
-            )
+            update["display_icon"] = await get_icon(update.pop("icon_url"), self.bot)
 
         if "color" in update:
             # convert hex to discord.Color
@@ -366,6 +430,7 @@ class MyCog(commands.Cog):
         print(f"{update.get('name')}")
         # update the role
         await role.edit(**update)
+        await self.store.update(interaction.user.id, stored)
 
         await interaction.followup.send("Updated your custom role!", ephemeral=True)
 
@@ -376,9 +441,7 @@ class MyCog(commands.Cog):
         await interaction.response.defer()
 
         # get role ID
-        document = await self.bot.custom_roles.find_one(
-            {"user_id": interaction.user.id}, {"role_id": 1}
-        )
+        document = self.store.get(interaction.user.id)
 
         if not document:
             await interaction.followup.send(
@@ -389,7 +452,7 @@ class MyCog(commands.Cog):
         role_id = document["role_id"]
 
         # delete all documents with the user ID
-        await self.bot.custom_roles.delete_many({"user_id": interaction.user.id})
+        await self.store.delete(interaction.user.id)
 
         # get role object
         role = interaction.guild.get_role(role_id)
@@ -408,7 +471,8 @@ class MyCog(commands.Cog):
     async def slots(self, interaction: discord.Interaction) -> None:
         """Displays the number of custom role slots available"""
 
-        resp = f"Custom role slots available: {(250 - len(interaction.guild.roles)) - 10}/250."
+        slots = self.role_names.slots(interaction.guild)
+        resp = f"Custom role slots available: {slots}/{ROLE_LIMIT}."
         await interaction.response.send_message(resp, ephemeral=True)
 
     @cr.command(name="patreon")
@@ -449,6 +513,29 @@ class MyCog(commands.Cog):
 
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        # the role events missed while the guild was away aren't replayed
+        self.role_names.build(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.role_names.forget(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        self.role_names.add(role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        self.role_names.update(before, after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        self.role_names.remove(role)
+        # a custom role deleted by hand frees its owner to create a new one
+        await self.store.delete_role(role.id)
+
     @create.error
     @update.error
     async def on_edit_error(
@@ -4,7 +4,7 @@ import random
 import asyncio
 import time
 from io import BytesIO
-import aiohttp
+import logging
 
 
 import discord
@@ -12,6 +12,9 @@ from discord.ext import commands, tasks
 from discord.ext.commands import BucketType, CommandOnCooldown, CooldownMapping
 
 from bot.constants import Channels, Roles, Whitelists
+from bot.exceptions import IconUnavailable
+
+log = logging.getLogger(__name__)
 
 
 SWITCHABLE_ROLES = {
@@ -30,12 +33,12 @@ SWITCHABLE_ROLES = {
 }
 
 
-async def get_icon_bytes(icon_url: str) -> Optional[bytes]:
-    async with aiohttp.ClientSession() as session:
-        async with session.get(icon_url) as resp:
-            if resp.status != 200:
-                return None
-            return await resp.read()
+async def get_icon_bytes(bot, icon_url: str) -> Optional[bytes]:
+    try:
+        return await bot.icons.get(icon_url)
+    except IconUnavailable as e:
+        log.warning("Couldn't get icon %s: %s", icon_url, e)
+        return None
 
 
 class Fun(commands.Cog):
@@ -46,14 +49,6 @@ class Fun(commands.Cog):
     async def on_cog_unload(self):
         self.switch_roles_task.cancel()
 
-    @commands.Cog.listener()
-    async def on_message(self, msg):
-        if msg.author.bot:
-            return
-
-        if not msg.guild:
-            return
-
     @tasks.loop(hours=2)
     async def switch_roles(self):
         guild = self.bot.get_guild(444470893599784960)
@@ -66,7 +61,7 @@ class Fun(commands.Cog):
         while True:
             for role_name, role_data in SWITCHABLE_ROLES.items():
                 # edit role
-                icon_bytes = await get_icon_bytes(role_data["icon"])
+                icon_bytes = await get_icon_bytes(self.bot, role_data["icon"])
                 await role.edit(
                     name=role_name,
                     color=role_data["color"],
@@ -10,8 +10,12 @@ class LockChannelCog(commands.Cog):
         self.target_count = 5
         self.locked_channels = {}
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
+        bot.dispatcher.register(self.on_lock_message)
+
+    def cog_unload(self):
+        self.bot.dispatcher.unregister(self)
+
+    async def on_lock_message(self, message, info):
         if (
             str(self.lock_emoji_id) in message.content
             and message.author.id == 982097011434201108
@@ -1,22 +1,22 @@
+import datetime
+import functools
 import re
 from typing import Optional
 
 import discord
 from discord.ext import commands
-from discord.ext.commands import BucketType, CommandOnCooldown, CooldownMapping
+from discord.ext.commands import BucketType
 
 from bot.cogs.utils import time
+from bot.cogs.utils.attachments import AttachmentKind, classify, has_kind
+from bot.cogs.utils.dispatch import MessageFlags
+from bot.cogs.utils.queues import WorkQueue
 from bot.constants import Channels, Roles, Whitelists
 
-DEFAULT_COOLDOWN = CooldownMapping.from_cooldown(1, 60, BucketType.member)
 IMAGE_LINK_REGEX = re.compile(
     r"(http(s?):)([/|.|\w|\s|-])*\.(?:jpg|jpeg|gif|png|svg)", re.IGNORECASE
 )
 
-# VC COOLDOWN
-VC_MEMBER_COOLDOWN = CooldownMapping.from_cooldown(2, 120, BucketType.member)
-VC_CHANNEL_COOLDOWN = CooldownMapping.from_cooldown(4, 120, BucketType.channel)
-
 
 def ac_chat_only():
     def predicate(ctx):
@@ -24,56 +24,77 @@ def ac_chat_only():
             return True
 
 
-async def apply_general_cooldown(msg):
+async def delete_and_notify(msg, notice=None, *, reason=None) -> bool:
+    """Deletes the message and DMs ``notice``, returns True if it was deleted."""
+    try:
+        await msg.delete(reason=reason)
+    except discord.HTTPException:
+        # already gone or not allowed, nothing was deleted by us
+        return False
+    if notice:
+        try:
+            await msg.author.send(notice)
+        except discord.HTTPException:
+            pass  # DMs disabled
+    return True
+
+
+async def apply_general_cooldown(msg, cooldown):
+    """Deletes images posted too often, returns True if the message was removed."""
     # ignore rate limits for mods
     if Roles.mod in [r.id for r in msg.author.roles]:
-        return
+        return False
 
-    bucket = DEFAULT_COOLDOWN.get_bucket(msg)
-    retry_after = bucket.update_rate_limit()
+    retry_after = cooldown.update_rate_limit(msg)
     if retry_after:
-        try:
-            await msg.delete(reason="On general image cooldown")
-            await msg.author.send(
-                f"Please wait {retry_after:.2f}s before posting another image in {msg.channel.mention}."
-            )
-        except discord.HTTPException:
-            pass
+        return await delete_and_notify(
+            msg,
+            f"Please wait {retry_after:.2f}s before posting another image in {msg.channel.mention}.",
+            reason="On general image cooldown",
+        )
+    return False
 
 
 async def delete_videos_in_general(msg):
+    """Deletes videos posted in general, returns True if the message was removed."""
     if msg.channel.id != Channels.general:
-        return
+        return False
 
-    if msg.attachments:
-        for attachment in msg.attachments:
-            if attachment.filename.endswith(".mp4"):
-                try:
-                    await msg.delete()
-                    # await msg.author.send(
-                    #     "Please do not post videos in the general channel."
-                    # )
-                except discord.HTTPException:
-                    pass
+    if has_kind(msg, AttachmentKind.VIDEO):
+        # "Please do not post videos in the general channel."
+        return await delete_and_notify(msg)
+    return False
 
 
 async def handle_media_only_channel_content(msg):
+    """Deletes chat in media channels, returns True if the message was removed."""
     if msg.attachments:
-        return
+        return False
     if msg.channel.type == discord.Thread:
-        return
+        return False
 
     # delete if message type is default or reply
     if any(
         msg.type == t for t in (discord.MessageType.default, discord.MessageType.reply)
     ):
-        try:
-            await msg.delete()
-            await msg.author.send(
-                "Please create a thread and post your reply there instead of directly replying to this channel."
-            )
-        except discord.HTTPException:
-            pass  # Ignore if user has DMs disabled or message is already gone
+        return await delete_and_notify(
+            msg,
+            "Please create a thread and post your reply there instead of directly replying to this channel.",
+        )
+    return False
+
+
+async def create_comment_thread(msg):
+    try:
+        await msg.channel.create_thread(
+            name=f"💬 {msg.author.display_name}'s post", message=msg
+        )
+    except discord.NotFound:
+        pass  # message was deleted before we got to it
+    except discord.HTTPException as e:
+        # a thread already exists for this message
+        if e.code != 160004:
+            raise
 
 
 class Duration(time.ShortTime):
@@ -95,63 +116,94 @@ class Moderation(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    @commands.Cog.listener()
-    async def on_message(self, msg):
-        if msg.author.bot:
+        cooldowns = bot.cooldowns
+        self.image_cooldown = cooldowns.limiter(
+            "general_images", 1, 60, BucketType.member
+        )
+        # VC COOLDOWN
+        self.vc_member_cooldown = cooldowns.limiter(
+            "voice_messages_member", 2, 120, BucketType.member
+        )
+        self.vc_channel_cooldown = cooldowns.limiter(
+            "voice_messages_channel", 4, 120, BucketType.channel
+        )
+
+        # comment threads are created in the background, one at a time
+        self.thread_queue = WorkQueue("media_threads")
+
+        dispatcher = bot.dispatcher
+        dispatcher.add_channel_class("general", [Channels.general])
+        dispatcher.add_channel_class("media", Whitelists.media_channels)
+
+        dispatcher.register(self.on_general_message, channel_class="general")
+        dispatcher.register(self.on_media_message, channel_class="media")
+        dispatcher.register(
+            self.handle_voice_messages_rate_limits,
+            flags=MessageFlags.ATTACHMENTS,
+            priority=10,
+        )
+
+    async def cog_unload(self):
+        self.bot.dispatcher.unregister(self)
+        await self.thread_queue.stop()
+
+    def log_deletion(self, msg, reason):
+        self.bot.modlog.record(
+            "delete",
+            guild_id=msg.guild.id,
+            user_id=msg.author.id,
+            channel_id=msg.channel.id,
+            reason=reason,
+        )
+
+    async def on_general_message(self, msg, info):
+        if await delete_videos_in_general(msg):
+            self.log_deletion(msg, "Video in general")
             return
 
-        if msg.guild is None:
-            return
-
-        # check for cooldown
-        if msg.channel.id == Channels.general:
-            await delete_videos_in_general(msg)
-            # check if msg has attachments or contains image link
-            if msg.attachments or IMAGE_LINK_REGEX.search(msg.content):
-                await apply_general_cooldown(msg)
-
-        if msg.channel.id in Whitelists.media_channels:
-            await handle_media_only_channel_content(msg)
+        # check if msg has attachments or contains image link
+        if info.flags & MessageFlags.ATTACHMENTS or (
+            info.flags & MessageFlags.LINK and IMAGE_LINK_REGEX.search(msg.content)
+        ):
+            if await apply_general_cooldown(msg, self.image_cooldown):
+                self.log_deletion(msg, "On general image cooldown")
 
-            if msg.attachments:
-                # auto add default comment thread
-                await msg.channel.create_thread(
-                    name=f"💬 {msg.author.display_name}'s post", message=msg
-                )
+    async def on_media_message(self, msg, info):
+        if await handle_media_only_channel_content(msg):
+            self.log_deletion(msg, "Chat in media channel")
 
         if msg.attachments:
-            await self.handle_voice_messages_rate_limits(msg)
+            # auto add default comment thread, keyed by message so it's only made once
+            self.thread_queue.submit(
+                msg.id, functools.partial(create_comment_thread, msg)
+            )
 
-    async def handle_voice_messages_rate_limits(self, msg):
-        attachment = msg.attachments[0]
-        voice_msg = attachment.is_voice_message()
-        if not voice_msg:
+    async def handle_voice_messages_rate_limits(self, msg, info):
+        if not classify(msg.attachments[0]).is_voice:
             return
 
         # check if user is on cooldown
-        bucket = VC_MEMBER_COOLDOWN.get_bucket(msg)
-        retry_after = bucket.update_rate_limit()
+        retry_after = self.vc_member_cooldown.update_rate_limit(msg)
         if retry_after:
-            try:
-                await msg.delete()
-                await msg.author.send(
-                    f"Please wait {retry_after:.2f}s before posting another voice message."
-                )
-            except discord.HTTPException:
-                pass
+            await self.delete_on_cooldown(
+                msg,
+                f"Please wait {retry_after:.2f}s before posting another voice message.",
+                "On voice message cooldown",
+            )
 
         # check if channel is on cooldown
-        bucket = VC_CHANNEL_COOLDOWN.get_bucket(msg)
-        retry_after = bucket.update_rate_limit()
+        retry_after = self.vc_channel_cooldown.update_rate_limit(msg)
 
         if retry_after:
-            try:
-                await msg.delete()
-                await msg.author.send(
-                    f"Please wait {retry_after:.2f}s before posting another voice message in {msg.channel.mention}."
-                )
-            except discord.HTTPException:
-                pass
+            await self.delete_on_cooldown(
+                msg,
+                f"Please wait {retry_after:.2f}s before posting another voice message in {msg.channel.mention}.",
+                "On channel voice message cooldown",
+            )
+
+    async def delete_on_cooldown(self, msg, notice, reason):
+        if await delete_and_notify(msg, notice):
+            self.log_deletion(msg, reason)
 
     @commands.command(aliases=["t"])
     @commands.has_permissions(moderate_members=True)
@@ -166,6 +218,44 @@ class Moderation(commands.Cog):
         """Timeout a list of members for a certain amount of time. Example: !t @user1 @user2 1h spam"""
         for m in members:
             await m.timeout(duration.dt, reason=reason)
+            self.bot.modlog.record(
+                "timeout",
+                guild_id=ctx.guild.id,
+                user_id=m.id,
+                moderator_id=ctx.author.id,
+                channel_id=ctx.channel.id,
+                reason=f"{reason} (until {duration.dt:%Y-%m-%d %H:%M} UTC)",
+            )
+
+    @commands.command()
+    @commands.has_permissions(moderate_members=True)
+    @commands.guild_only()
+    async def modlog(self, ctx: commands.Context, user: discord.User):
+        """Shows the latest moderation actions against a user. Example: !modlog @user"""
+        events = await self.bot.modlog.history(ctx.guild.id, user.id)
+        if not events:
+            return await ctx.send(
+                f"No moderation actions recorded for {user}.", reference=ctx.message
+            )
+
+        lines = []
+        for e in events:
+            created_at = e["created_at"].replace(tzinfo=datetime.timezone.utc)
+            line = f"{discord.utils.format_dt(created_at, 'R')} **{e['action']}**"
+            if "moderator_id" in e:
+                line += f" by <@{e['moderator_id']}>"
+            if "channel_id" in e:
+                line += f" in <#{e['channel_id']}>"
+            if "reason" in e:
+                line += f": {e['reason']}"
+            lines.append(line)
+
+        embed = discord.Embed(color=discord.Color.red())
+        embed.set_author(name=f"Mod log for {user}", icon_url=user.display_avatar.url)
+        embed.description = "\n".join(lines)[:4096]
+        embed.set_footer(text=f"User ID: {user.id}")
+
+        await ctx.send(embed=embed, reference=ctx.message)
 
     @commands.command(aliases=["st"])
     async def self_timeout(
@@ -203,46 +203,38 @@ class Modmail(commands.Cog):
         if ticket is not None:
             await ticket.send(f"{member} left the server.")
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        pass
-        # # only dm messages
-        # if not isinstance(message.channel, discord.DMChannel):
-        #     return
-
-        # if message.author.bot:
-        #     return
-
-        # # check if the message author is a member of the guild
-        # if message.author.id not in self.guild_members:
-        #     return
-
-        # # check if the message author has a ticket
-        # # if not, create one
-        # if message.author.id not in self.tickets:
-        #     # create a ticket
-        #     category = self.bot.get_channel(Categories.modmail)
-        #     ticket = await category.create_text_channel(
-        #         name=f"{message.author.name}-{message.author.discriminator}",
-        #         topic=f"Ticket for {message.author.mention}"
-        #     )
-        #     self.tickets[message.author.id] = ticket.id
-
-        #     # send a message to the ticket
-        #     await ticket.send(f"Ticket created for {message.author.mention}.")
-
-        # else:
-        #     # get the ticket
-        #     ticket = self.bot.get_channel(self.tickets[message.author.id])
-
-        #     # send the message to the ticket
-        #     embed = discord.Embed(
-        #         description=message.content,
-        #         color=discord.Color.blurple()
-        #     )
-
-        #     embed.set_author(name=message.author, icon_url=message.author.avatar_url)
-        #     await ticket.send(embed=embed)
+    # dm relay draft, not implemented. once it is, register it with
+    # bot.dispatcher for the "dm" channel class in cog_load
+    # # check if the message author is a member of the guild
+    # if message.author.id not in self.guild_members:
+    #     return
+
+    # # check if the message author has a ticket
+    # # if not, create one
+    # if message.author.id not in self.tickets:
+    #     # create a ticket
+    #     category = self.bot.get_channel(Categories.modmail)
+    #     ticket = await category.create_text_channel(
+    #         name=f"{message.author.name}-{message.author.discriminator}",
+    #         topic=f"Ticket for {message.author.mention}"
+    #     )
+    #     self.tickets[message.author.id] = ticket.id
+
+    #     # send a message to the ticket
+    #     await ticket.send(f"Ticket created for {message.author.mention}.")
+
+    # else:
+    #     # get the ticket
+    #     ticket = self.bot.get_channel(self.tickets[message.author.id])
+
+    #     # send the message to the ticket
+    #     embed = discord.Embed(
+    #         description=message.content,
+    #         color=discord.Color.blurple()
+    #     )
+
+    #     embed.set_author(name=message.author, icon_url=message.author.avatar_url)
+    #     await ticket.send(embed=embed)
 
     # delete the ticket when the user leaves the guild or channel is deleted
 
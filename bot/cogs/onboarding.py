@@ -1,31 +1,166 @@
 import asyncio
+import datetime
+import functools
+import time
+from typing import List, Optional
 
 import discord
 from discord.ext import commands, tasks
 
-from bot.constants import Channels, Guilds
+from bot.cogs.utils.formats import human_join
+from bot.cogs.utils.mass_actions import ProgressReport, mass_ban, run_bounded
+from bot.cogs.utils.raids import RaidAction, RaidDetector
+from bot.cogs.utils.telemetry import MinuteCounters, sparkline
+from bot.constants import Channels, Guilds, Raids, Welcomes
+
+MESSAGE_LIMIT = 2000
+RAID_REASON = "Potential raid"
+RAID_ACTION_LABELS = {
+    RaidAction.QUARANTINE: "Quarantined",
+    RaidAction.KICK: "Kicked",
+    RaidAction.BAN: "Banned",
+}
+
+
+def render_welcome(mentions: List[str]) -> str:
+    return f"Welcome {human_join(mentions, final='and')}!"
+
+
+class WelcomeMessage:
+    """A sent welcome message and the members it mentions."""
+
+    def __init__(self, message: discord.Message, mentions: List[str]):
+        self.message = message
+        self.mentions = mentions
+        self.sent_at = time.monotonic()
 
 
 class Onboarding(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.new_members_queue = []
+        self.raid_detector = RaidDetector(
+            [(w["seconds"], w["joins"]) for w in Raids.windows],
+            min_score=Raids.min_score,
+            new_account_days=Raids.new_account_days,
+            escalation=Raids.escalation,
+        )
+        self.pending_raid_actions = []
+        # latest welcome message, joins within the edit window are added to it
+        self.last_welcome: Optional[WelcomeMessage] = None
+        # staff message of the ongoing raid, edited as accounts are handled
+        self.raid_report = None
+        # joins, leaves and bans per minute over the last week
+        self.join_stats = MinuteCounters(("joins", "leaves", "bans"))
         self.join_watcher.start()
 
-    def cog_unload(self):
+    async def cog_load(self):
+        doc = await self.bot.telemetry.find_one({"_id": "join_stats"})
+        if doc:
+            self.join_stats.load_document(doc)
+        self.save_join_stats.start()
+
+    async def cog_unload(self):
         self.join_watcher.cancel()
+        self.save_join_stats.cancel()
+        await self.save_join_stats()
+
+    @tasks.loop(minutes=10)
+    async def save_join_stats(self):
+        await self.bot.telemetry.replace_one(
+            {"_id": "join_stats"},
+            {"_id": "join_stats", **self.join_stats.to_document()},
+            upsert=True,
+        )
+
+    def take_welcome_batch(self, mentions: List[str], batch: List[str]) -> bool:
+        """Move mentions into ``batch`` while it stays within the size limits."""
+        changed = False
+        while mentions and len(batch) < Welcomes.max_members:
+            if len(render_welcome(batch + mentions[:1])) > MESSAGE_LIMIT:
+                break
+            batch.append(mentions.pop(0))
+            changed = True
+        return changed
 
-    async def send_welcome_message(self, member: discord.Member):
-        system_channel = member.guild.system_channel
-        await system_channel.send(f"Welcome {member.mention}!")
+    async def send_welcome_messages(self, members: List[discord.Member]):
+        """Welcome a burst of members with as few messages as possible."""
+        system_channel = members[0].guild.system_channel
+        if system_channel is None:
+            return
+
+        mentions = [m.mention for m in members]
+
+        # add them to the last welcome if it's recent enough
+        last = self.last_welcome
+        if last is not None and time.monotonic() - last.sent_at < Welcomes.edit_window:
+            batch = last.mentions.copy()
+            if self.take_welcome_batch(mentions, batch):
+                try:
+                    await last.message.edit(content=render_welcome(batch))
+                except discord.HTTPException:
+                    # gone, send them a new one instead
+                    mentions[:0] = batch[len(last.mentions) :]
+                else:
+                    last.mentions = batch
+
+        while mentions:
+            batch = []
+            if not self.take_welcome_batch(mentions, batch):
+                break
+            message = await system_channel.send(render_welcome(batch))
+            self.last_welcome = WelcomeMessage(message, batch)
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        return
         if member.guild.id != Guilds.cc:
             return
 
-        self.new_members_queue.append(member)
+        self.join_stats.incr("joins")
+
+        # both are switched on in config.yml
+        if Welcomes.enabled:
+            self.new_members_queue.append(member)
+        if not Raids.enabled:
+            return
+
+        # acted upon in batches by the join watcher
+        self.pending_raid_actions.extend(self.raid_detector.observe(member))
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        if member.guild.id != Guilds.cc:
+            return
+        self.join_stats.incr("leaves")
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild, user):
+        if guild.id != Guilds.cc:
+            return
+        self.join_stats.incr("bans")
+
+    @commands.command()
+    @commands.has_permissions(moderate_members=True)
+    async def joinstats(self, ctx):
+        """Shows joins, leaves and bans of the last day and week."""
+        embed = discord.Embed(title="Join stats", color=discord.Color.red())
+
+        for metric in self.join_stats.counts:
+            hourly = self.join_stats.buckets(metric, 60, 24)
+            daily = self.join_stats.buckets(metric, 24 * 60, 7)
+            embed.add_field(
+                name=metric.title(),
+                value=(
+                    f"Last 24h: **{sum(hourly)}** (peak {max(hourly)}/h)\n"
+                    f"`{sparkline(hourly)}`\n"
+                    f"Last 7d: **{sum(daily)}**\n"
+                    f"`{sparkline(daily)}` {', '.join(map(str, daily))}"
+                ),
+                inline=False,
+            )
+
+        embed.set_footer(text="Hourly for the last day, daily for the last week")
+        await ctx.send(embed=embed, reference=ctx.message)
 
     @tasks.loop(seconds=3)
     async def join_watcher(self):
@@ -37,31 +172,113 @@ class Onboarding(commands.Cog):
         await asyncio.sleep(10)
 
     async def process_joins(self):
+        if self.pending_raid_actions:
+            await self.handle_raid_actions()
+
         new_members = self.new_members_queue.copy()
         self.new_members_queue.clear()
 
-        if not len(new_members) >= 5:
-            for member in new_members:
-                if not isinstance(member, discord.Member):
-                    continue
-                await self.send_welcome_message(member)
+        # don't welcome raid accounts
+        welcome = [
+            m
+            for m in new_members
+            if isinstance(m, discord.Member) and not self.raid_detector.is_flagged(m.id)
+        ]
+        if welcome:
+            await self.send_welcome_messages(welcome)
 
-            return
+        # the raid is over once every window has calmed down
+        if self.raid_report is not None and self.raid_detector.pressure() == 0:
+            self.raid_report.title = "Raid over."
+            await self.raid_report.update(force=True)
+            self.raid_report = None
 
-        for member in new_members:
-            try:
-                await member.ban(reason="Potential raid")
-            except discord.HTTPException as e:
-                print("Failed to ban user:", e)
+    async def apply_raid_action(self, member: discord.Member, action: RaidAction):
+        if action is RaidAction.QUARANTINE:
+            until = datetime.timedelta(minutes=Raids.quarantine_minutes)
+            await member.timeout(until, reason=RAID_REASON)
+        elif action is RaidAction.KICK:
+            await member.kick(reason=RAID_REASON)
 
-        staff_room = self.bot.get_channel(Channels.staff_room)
+    def record_raid_action(self, guild_id: int, user_id: int, action: RaidAction):
+        self.bot.modlog.record(
+            action.name.lower(),
+            guild_id=guild_id,
+            user_id=user_id,
+            moderator_id=self.bot.user.id,
+            reason=RAID_REASON,
+        )
 
-        if not staff_room:
-            return
+    async def handle_raid_actions(self):
+        actions, self.pending_raid_actions = self.pending_raid_actions, []
 
-        await staff_room.send(
-            f"Potential raid detected. Banned {len(new_members)} accounts."
-        )
+        # a member escalated several times in one tick only needs the last action
+        strongest = {}
+        for member, action in actions:
+            if action > strongest.get(member, RaidAction.NONE):
+                strongest[member] = action
+
+        groups = {}
+        for member, action in strongest.items():
+            groups.setdefault(action, []).append(member)
+
+        level = self.raid_detector.level
+        title = f"Potential raid detected, escalated to **{level.name.lower()}**."
+        if self.raid_report is None:
+            staff_room = self.bot.get_channel(Channels.staff_room)
+            if staff_room is not None:
+                self.raid_report = ProgressReport(staff_room, title)
+        report = self.raid_report
+
+        if report is not None:
+            report.title = title
+            for action, members in groups.items():
+                report.queue(RAID_ACTION_LABELS[action], len(members))
+            await report.update(force=True)
+
+        guild = self.bot.get_guild(Guilds.cc)
+
+        for action in (RaidAction.QUARANTINE, RaidAction.KICK):
+            members = groups.get(action)
+            if not members:
+                continue
+
+            async def on_result(member, error, action=action):
+                if error is None:
+                    self.record_raid_action(member.guild.id, member.id, action)
+                else:
+                    print(f"Failed to {action.name.lower()} user:", error)
+
+                if report is not None:
+                    report.add(
+                        RAID_ACTION_LABELS[action],
+                        done=error is None,
+                        failed=error is not None,
+                    )
+                    await report.update()
+
+            await run_bounded(
+                members,
+                functools.partial(self.apply_raid_action, action=action),
+                on_result=on_result,
+            )
+
+        members = groups.get(RaidAction.BAN)
+        if members and guild is not None:
+            banned, failed = await mass_ban(
+                guild,
+                members,
+                reason=RAID_REASON,
+                report=report,
+                label=RAID_ACTION_LABELS[RaidAction.BAN],
+            )
+            for user_id in banned:
+                self.record_raid_action(guild.id, user_id, RaidAction.BAN)
+            if failed:
+                print(f"Failed to ban {len(failed)} users")
+
+        if report is not None:
+            await report.update(force=True)
 
 
 async def setup(bot):
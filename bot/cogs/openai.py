@@ -1,19 +1,32 @@
+import contextlib
 import functools
 import re
-from concurrent.futures import thread
-from typing import Optional
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
-import openai
+import discord
 from discord.ext import commands
 
-from bot.constants import Guilds, Keys, Threads
-
-openai.api_key = Keys.openai_key
+from bot.cogs.utils.cache import CoalescingCache
+from bot.cogs.utils.completions import CompletionClient
+from bot.cogs.utils.references import ReferenceResolver
+from bot.cogs.utils.scheduler import CallScheduler
+from bot.cogs.utils.usage import UsageTracker
+from bot.constants import Guilds, Keys, OpenAIConfig, Roles, Threads
 
 EMOJI_RE = re.compile(r"<(a?):([A-Za-z0-9_]+):([0-9]+)>")
 MENTION_RE = re.compile(r"<@?(!?)(#?)(&?)([0-9]*)>")
 
 
+def is_mod(member):
+    return member.guild.get_role(Roles.mod) in member.roles
+
+
+def estimate_tokens(text):
+    """Roughly 4 characters per token for english text."""
+    return len(text) // 4
+
+
 def clean_message(msg):
     """Removes emojis, mentions, and links from a message."""
 
@@ -23,15 +36,53 @@ def clean_message(msg):
     return new_msg.strip()
 
 
-def is_clean_with_ref(ctx):
-    """Checks if the message is clean and has a reference."""
-    ref = ctx.message.reference
-    if not ref:
-        return
-
-    clean = clean_message(ref.cached_message.content)
-
-    return clean if clean else False
+class StreamingReply:
+    """A message that grows as a completion streams in.
+
+    Edits are spaced at least ``interval`` seconds apart, the chunks in
+    between are batched into the next edit.
+    """
+
+    def __init__(self, message: discord.Message, *, interval: float = 1.0):
+        self.message = message
+        self.interval = interval
+        self.shown = message.content
+        # everything received so far
+        self.text = ""
+        # about one token per chunk
+        self.chunks = 0
+        # set once a broken off stream was left on screen
+        self.cut = False
+
+    async def show(self, text: str):
+        text = text.strip()[:2000] or "No response."
+        if text != self.shown:
+            await self.message.edit(content=text)
+            self.shown = text
+
+    async def consume(self, chunks: AsyncIterator[str]) -> str:
+        """Stream ``chunks`` into the message, returns the whole text."""
+        # the first words go out right away
+        last_edit = float("-inf")
+        async for chunk in chunks:
+            self.text += chunk
+            self.chunks += 1
+            if self.text.strip() and time.monotonic() - last_edit >= self.interval:
+                await self.show(self.text)
+                last_edit = time.monotonic()
+
+        await self.show(self.text)
+        return self.text
+
+    async def cut_off(self) -> bool:
+        """Keep what arrived of a broken off stream, returns False if there's none."""
+        text = self.text.strip()
+        if not text:
+            return False
+        notice = "\n*(cut off)*"
+        await self.message.edit(content=text[: 2000 - len(notice)] + notice)
+        self.cut = True
+        return True
 
 
 class OpenAI(commands.Cog):
@@ -40,6 +91,33 @@ class OpenAI(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.cmd_enabled = False
+        self.client = CompletionClient(
+            bot,
+            Keys.openai_key,
+            base_url=OpenAIConfig.base_url,
+            timeout=OpenAIConfig.timeout,
+            retries=OpenAIConfig.retries,
+        )
+        # identical prompts share one response, e.g. !english on the same message
+        self.cache = CoalescingCache(OpenAIConfig.cache_size, OpenAIConfig.cache_ttl)
+        # one budget for every command, so they can't exceed the API limits together
+        self.scheduler = CallScheduler(
+            requests_per_minute=OpenAIConfig.requests_per_minute,
+            tokens_per_minute=OpenAIConfig.tokens_per_minute,
+            max_concurrent=OpenAIConfig.max_concurrent,
+            max_queue=OpenAIConfig.max_queue,
+        )
+        self.usage = UsageTracker(
+            bot.ai_usage, flush_interval=OpenAIConfig.usage_flush_interval
+        )
+        self.references = ReferenceResolver(clean_message)
+
+    async def cog_load(self):
+        self.usage.flusher.start()
+
+    async def cog_unload(self):
+        self.scheduler.stop()
+        await self.usage.close()
 
     async def cog_check(self, ctx):
         if ctx.guild.id != Guilds.cc:
@@ -49,8 +127,44 @@ class OpenAI(commands.Cog):
 
         return False
 
-    def get_openapi_response(
+    @contextlib.asynccontextmanager
+    async def completion_slot(self, ctx, params):
+        """Waits for the shared budget, telling the invoker when they're queued."""
+        notice = None
+
+        async def on_queued(position):
+            nonlocal notice
+            notice = await ctx.reply(
+                f"Lots of requests right now, you're queued at position {position}.",
+                mention_author=False,
+            )
+
+        # mods go first, then everyone in order
+        priority = 0 if is_mod(ctx.author) else 1
+        # the prompt plus everything it may generate
+        tokens = estimate_tokens(params["prompt"]) + params["max_tokens"]
+
+        async with self.scheduler.slot(
+            priority=priority, tokens=tokens, on_queued=on_queued
+        ) as ticket:
+            if notice is not None:
+                try:
+                    await notice.delete()
+                except discord.HTTPException:
+                    pass
+            yield ticket
+
+    async def get_referenced_text(self, ctx):
+        """Returns the message ``ctx`` replies to and its clean text, if it has any."""
+        message = await self.references.resolve(ctx)
+        if message is None:
+            return None, None
+
+        return message, self.references.clean(message) or None
+
+    async def get_openapi_response(
         self,
+        ctx,
         *,
         prompt,
         stop,
@@ -58,23 +172,126 @@ class OpenAI(commands.Cog):
         temperature=0.7,
         frequency_penalty=0,
         presence_penalty=0,
+        engine=None,
+        cache=True,
     ):
         """
         Returns a response from OpenAI.ai.
+
+        Prompts asking for something random pass ``cache=False``, everyone
+        would get the same answer for a while otherwise.
         """
 
-        response = openai.Completion.create(
-            engine="text-davinci-003",
+        params = dict(
+            model=engine or OpenAIConfig.model,
             prompt=prompt,
             temperature=temperature,
             max_tokens=tokens,
-            top_p=1,
             frequency_penalty=frequency_penalty,
             presence_penalty=presence_penalty,
-            stop=[stop],
+            stop=stop,
+        )
+
+        # only set when this call went upstream, not for cached or coalesced ones
+        completion = None
+
+        async def complete():
+            nonlocal completion
+            async with self.completion_slot(ctx, params) as ticket:
+                completion = await self.client.complete(**params)
+                ticket.used = completion.total_tokens
+            return completion.text
+
+        started = time.perf_counter()
+        if cache:
+            key = tuple(sorted(params.items()))
+            text = await self.cache.get_or_compute(key, complete)
+        else:
+            text = await complete()
+
+        self.usage.record(
+            ctx.command.qualified_name,
+            ctx.author.id,
+            prompt_tokens=completion.prompt_tokens if completion else 0,
+            completion_tokens=completion.completion_tokens if completion else 0,
+            latency=time.perf_counter() - started,
+            cached=completion is None,
         )
+        return text
+
+    async def stream_openapi_response(
+        self,
+        ctx,
+        send: Callable[[str], Awaitable[discord.Message]],
+        *,
+        prompt,
+        stop,
+        tokens,
+        temperature=0.7,
+        engine=None,
+        cache=True,
+    ):
+        """
+        Posts a response from OpenAI.ai with ``send``, editing it in as it's generated.
 
-        return response["choices"][0]["text"]
+        With ``cache=False`` only identical prompts running at the same time
+        share a response.
+        """
+
+        params = dict(
+            model=engine or OpenAIConfig.model,
+            prompt=prompt,
+            temperature=temperature,
+            max_tokens=tokens,
+            frequency_penalty=0,
+            presence_penalty=0,
+            stop=stop,
+        )
+        key = tuple(sorted(params.items()))
+
+        # only set for the caller whose call streamed, not for cached or
+        # coalesced ones, those get the finished text in one message
+        reply = None
+
+        async def stream():
+            nonlocal reply
+            async with self.completion_slot(ctx, params) as ticket:
+                message = await send("\u2026")
+                reply = StreamingReply(
+                    message, interval=OpenAIConfig.stream_edit_interval
+                )
+                try:
+                    text = await reply.consume(self.client.stream(**params))
+                except Exception:
+                    # keep what's on screen already, only a bare placeholder goes
+                    with contextlib.suppress(discord.HTTPException):
+                        if not await reply.cut_off():
+                            await message.delete()
+                    raise
+
+                # streams don't report usage, count the chunks instead
+                ticket.used = estimate_tokens(prompt) + reply.chunks
+            return text
+
+        started = time.perf_counter()
+        try:
+            text = await self.cache.get_or_compute(key, stream, store=cache)
+        except Exception:
+            # the partial answer is the reply, it's not cached though
+            if reply is None or not reply.cut:
+                raise
+        else:
+            if reply is None:
+                await send(text.strip()[:2000] or "No response.")
+
+        self.usage.record(
+            ctx.command.qualified_name,
+            ctx.author.id,
+            prompt_tokens=estimate_tokens(prompt) if reply else 0,
+            completion_tokens=reply.chunks if reply else 0,
+            latency=time.perf_counter() - started,
+            cached=reply is None,
+        )
 
     @commands.command(enabled=False)
     @commands.is_owner()
@@ -89,65 +306,69 @@ class OpenAI(commands.Cog):
     @commands.cooldown(1, 30, commands.BucketType.user)
     async def explain(self, ctx):
         """Explain a text for you"""
-        clean_text = is_clean_with_ref(ctx)
+        referenced, clean_text = await self.get_referenced_text(ctx)
         if not clean_text:
             return
 
-        res = self.get_openapi_response(
-            prompt=f"Explain the meaning of this text from {ctx.message.reference.cached_message.author.display_name.title()}:\n{clean_text}\nExplanation:",
+        ref = referenced.to_reference()
+        await self.stream_openapi_response(
+            ctx,
+            functools.partial(ctx.send, reference=ref),
+            prompt=f"Explain the meaning of this text from {referenced.author.display_name.title()}:\n{clean_text}\nExplanation:",
             stop="Explanation:",
             tokens=256,
         )
-        ref = ctx.message.reference.cached_message.to_reference()
-        await ctx.send(content=res, reference=ref)
 
     @commands.command(enabled=False)
     @commands.cooldown(1, 30, commands.BucketType.user)
     async def answer(self, ctx):
         """Answers a question for you"""
-        clean_text = is_clean_with_ref(ctx)
+        referenced, clean_text = await self.get_referenced_text(ctx)
         if not clean_text:
             return
 
-        res = self.get_openapi_response(
+        res = await self.get_openapi_response(
+            ctx,
             prompt=f"Generate a quick response for this question:\n{clean_text}\nresponse:",
             stop="Response:",
             tokens=256,
         )
 
-        ref = ctx.message.reference.cached_message.to_reference()
+        ref = referenced.to_reference()
         await ctx.send(content=res, reference=ref)
 
     @commands.command(enabled=False)
     @commands.cooldown(1, 30, commands.BucketType.user)
     async def tldr(self, ctx):
         """Summarizes a long text for you"""
-        clean_text = is_clean_with_ref(ctx)
+        referenced, clean_text = await self.get_referenced_text(ctx)
         if not clean_text:
             return
 
-        res = self.get_openapi_response(
+        res = await self.get_openapi_response(
+            ctx,
             prompt=f"Summarize this for a second-grade student:\n{clean_text}\nsummary:",
             stop="Response:",
             tokens=75,
         )
-        ref = ctx.message.reference.cached_message.to_reference()
+        ref = referenced.to_reference()
         await ctx.send(content=res, reference=ref)
 
     @commands.command()
     @commands.cooldown(1, 30, commands.BucketType.user)
     async def english(self, ctx):
         """Corrects grammar and spelling errors in a text for you"""
-        clean_text = is_clean_with_ref(ctx)
+        referenced, clean_text = await self.get_referenced_text(ctx)
         if not clean_text:
             return
 
-        res = self.get_openapi_response(
+        res = await self.get_openapi_response(
+            ctx,
             prompt=f"Correct this to standard English:\n{clean_text}\ncorrection:",
             stop="Correction:",
             tokens=60,
         )
-        ref = ctx.message.reference.cached_message.to_reference()
+        ref = referenced.to_reference()
         await ctx.send(content=res, reference=ref)
 
     @commands.command(enabled=False)
@@ -162,13 +383,13 @@ class OpenAI(commands.Cog):
         )
 
         async with ctx.channel.typing():
-            func = functools.partial(
-                self.get_openapi_response,
+            res = await self.get_openapi_response(
+                ctx,
                 prompt=f"{prompt}\nfact:",
                 stop="Fact:",
                 tokens=60,
+                cache=bool(topic),
             )
-            res = await self.bot.loop.run_in_executor(None, func)
 
             await ctx.reply(res)
 
@@ -181,20 +402,15 @@ class OpenAI(commands.Cog):
         if not question:
             return
 
-        async with ctx.channel.typing():
-            response = openai.Completion.create(
-                engine="text-davinci-002",
-                prompt=f"I am a highly intelligent question answering bot.\n\nQuestion:{question}\nAnswer:",
-                temperature=0,
-                max_tokens=256,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0,
-                stop=["Answer:"],
-            )
-
-        res = response["choices"][0]["text"]
-        await ctx.send(content=res.lstrip("\n"))
+        await self.stream_openapi_response(
+            ctx,
+            ctx.send,
+            engine="text-davinci-002",
+            prompt=f"I am a highly intelligent question answering bot.\n\nQuestion:{question}\nAnswer:",
+            temperature=0,
+            tokens=256,
+            stop="Answer:",
+        )
 
     @commands.command(enabled=False)
     @commands.cooldown(1, 20, commands.BucketType.member)
@@ -210,18 +426,16 @@ class OpenAI(commands.Cog):
 
             prompt = f"Generate a thought-provoking question about {cat_clean.title()}:"
 
-        response = openai.Completion.create(
+        r = await self.get_openapi_response(
+            ctx,
             engine="text-davinci-002",
             prompt=f"{prompt}\nQuestion:",
             temperature=1,
-            max_tokens=256,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0,
-            stop=["Question:"],
+            tokens=256,
+            stop="Question:",
+            cache=bool(category),
         )
 
-        r = response["choices"][0]["text"]
         await ctx.send(content=r, reference=ctx.message.to_reference())
 
     @commands.command(enabled=False)
@@ -235,16 +449,15 @@ class OpenAI(commands.Cog):
 
         prompt = f"Create a fake story between {names}."
 
-        async with ctx.channel.typing():
-            func = functools.partial(
-                self.get_openapi_response,
-                prompt=f"{prompt}\nStory:",
-                stop="Story:",
-                tokens=120,
-            )
-            res = await self.bot.loop.run_in_executor(None, func)
-
-            await ctx.send(content=res)
+        await self.stream_openapi_response(
+            ctx,
+            ctx.send,
+            prompt=f"{prompt}\nStory:",
+            stop="Story:",
+            tokens=120,
+            # a new story every time
+            cache=False,
+        )
 
 
 async def setup(bot):
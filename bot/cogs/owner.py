@@ -5,8 +5,11 @@ import re
 import subprocess
 import sys
 
+import discord
 from discord.ext import commands
 
+from bot.cogs.utils.formats import TabularData
+
 
 class Owner(commands.Cog):
     def __init__(self, bot):
@@ -149,6 +152,123 @@ class Owner(commands.Cog):
         else:
             await ctx.send("\u2705")
 
+    @commands.command()
+    @commands.is_owner()
+    async def pipeline(self, ctx, reset: bool = False):
+        """Shows per-stage timings of the message dispatch pipeline."""
+        dispatcher = self.bot.dispatcher
+
+        if reset:
+            dispatcher.reset_timings()
+            return await ctx.send("\u2705")
+
+        if not dispatcher.timings:
+            return await ctx.send("No messages dispatched yet.")
+
+        table = TabularData()
+        table.set_columns(["Stage", "Calls", "Avg (µs)", "Max (µs)"])
+        for stage, timing in dispatcher.timings.items():
+            table.add_row(
+                [stage, timing.calls, f"{timing.avg_us:.1f}", f"{timing.max_us:.1f}"]
+            )
+
+        await ctx.send(f"```\n{table.render()}\n```")
+
+    @commands.command()
+    @commands.is_owner()
+    async def cooldowns(self, ctx):
+        """Shows the size and counters of every shared cooldown."""
+        stats = self.bot.cooldowns.stats()
+        if not stats:
+            return await ctx.send("No cooldowns registered.")
+
+        table = TabularData()
+        table.set_columns(
+            ["Cooldown", "Size", "Capacity", "Allowed", "Limited", "LRU", "Idle"]
+        )
+        for s in stats:
+            table.add_row(
+                [
+                    s["name"],
+                    s["size"],
+                    s["capacity"],
+                    s["allowed"],
+                    s["limited"],
+                    s["evicted_full"],
+                    s["evicted_idle"],
+                ]
+            )
+
+        await ctx.send(f"```\n{table.render()}\n```")
+
+    @commands.command()
+    @commands.is_owner()
+    async def aicache(self, ctx, clear: bool = False):
+        """Shows how well the OpenAI response cache is doing."""
+        cog = self.bot.get_cog("OpenAI")
+        if cog is None:
+            return await ctx.send("OpenAI commands aren't loaded.")
+
+        cache = cog.cache
+        if clear:
+            cache.clear()
+            return await ctx.send("\u2705")
+
+        table = TabularData()
+        table.set_columns(["Metric", "Value"])
+        table.add_rows(
+            [
+                ["Entries", f"{len(cache)}/{cache.cache.maxsize}"],
+                ["Requests", cache.requests],
+                ["Cache hits", cache.cache.hits],
+                ["Coalesced", cache.coalesced],
+                ["Hit ratio", f"{cache.hit_ratio:.1%}"],
+                ["Saved latency", f"{cache.saved_seconds:.1f}s"],
+            ]
+        )
+        await ctx.send(f"```\n{table.render()}\n```")
+
+    @commands.command()
+    @commands.is_owner()
+    async def aistats(self, ctx):
+        """Shows tokens and latency of the OpenAI commands, per command and top users."""
+        cog = self.bot.get_cog("OpenAI")
+        if cog is None:
+            return await ctx.send("OpenAI commands aren't loaded.")
+
+        await cog.usage.flush()
+        per_command = await cog.usage.top("command", limit=25)
+        users = await cog.usage.top("user", limit=10)
+        if not per_command:
+            return await ctx.send("No completions recorded yet.")
+
+        table = TabularData()
+        table.set_columns(
+            ["Command", "Calls", "Cached", "Prompt", "Output", "Avg tokens", "Avg ms"]
+        )
+        for doc in per_command:
+            upstream = max(doc["calls"] - doc["cache_hits"], 1)
+            table.add_row(
+                [
+                    doc["name"],
+                    doc["calls"],
+                    doc["cache_hits"],
+                    doc["prompt_tokens"],
+                    doc["completion_tokens"],
+                    doc["tokens"] // upstream,
+                    f"{doc['latency'] / doc['calls'] * 1000:.0f}",
+                ]
+            )
+
+        top_users = "\n".join(
+            f"<@{doc['name']}>: {doc['tokens']} tokens in {doc['calls']} calls"
+            for doc in users
+        )
+        await ctx.send(
+            f"```\n{table.render()}\n```\n**Top users**\n{top_users}",
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+
     @commands.command()
     @commands.is_owner()
     async def shutdown(self, ctx):
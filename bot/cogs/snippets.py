@@ -7,8 +7,9 @@ from typing import Optional, Union
 import discord
 from discord import app_commands
 from discord.ext import commands
-from discord.ext.commands import BucketType, CommandOnCooldown, CooldownMapping
+from discord.ext.commands import BucketType
 
+from bot.cogs.utils.attachments import classify
 from bot.constants import Channels, Guilds
 from bot.exceptions import SnippetDoesNotExist, SnippetExists
 
@@ -16,8 +17,6 @@ IMAGE_URL_PATTERN = re.compile(
     r"(http(s?):)([/|.|\w|\s|-])*\.(?:jpg|jpeg|gif|png|svg)", re.IGNORECASE
 )
 
-DEFAULT_COOLDOWN = CooldownMapping.from_cooldown(1, 20, BucketType.channel)
-
 
 class SnippetsGroup(app_commands.Group):
     """Group to manage all snippet commands"""
@@ -62,10 +61,16 @@ class SnippetsGroup(app_commands.Group):
 class Snippets(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.cooldown = bot.cooldowns.limiter("snippets", 1, 20, BucketType.channel)
+
+        # chill corner only
+        bot.dispatcher.register(self.on_snippet_message, guild_id=Guilds.cc, prefix=";")
+
+    def cog_unload(self):
+        self.bot.dispatcher.unregister(self)
 
     async def is_on_snippet_cooldown(self, msg: discord.Message):
-        bucket = DEFAULT_COOLDOWN.get_bucket(msg)
-        return bucket.update_rate_limit()
+        return self.cooldown.update_rate_limit(msg)
 
     async def snippet_exists(self, name: str):
         return await self.bot.snippets.find_one(
@@ -77,22 +82,7 @@ class Snippets(commands.Cog):
             f"Snipppet with this name does not exist.", reference=ctx.message
         )
 
-    @commands.Cog.listener()
-    async def on_message(self, msg):
-        if msg.author.bot:
-            return
-
-        # ignore dms
-        if not msg.guild:
-            return
-
-        # chill corner only
-        if msg.guild.id != Guilds.cc:
-            return
-
-        if not msg.content.startswith(";"):
-            return
-
+    async def on_snippet_message(self, msg, info):
         title = msg.content[1:].strip()
         if not title:
             return
@@ -172,9 +162,14 @@ class Snippets(commands.Cog):
 
         # get the CDN link from the attachment
         if attachments:
-
-            # get the image file extension from the URL
-            ext = ctx.message.attachments[0].url.split(".")[-1]
+            info = classify(attachments[0])
+            if not info.is_image:
+                return await ctx.send(
+                    "Snippet attachments must be images.", reference=ctx.message
+                )
+
+            # get the image file extension from the content type
+            ext = info.extension or "png"
 
             # create temp folder if it doesn't exist
             if not os.path.exists("./temp"):
@@ -0,0 +1,124 @@
+"""Attachment classification from gateway metadata.
+
+Uses the ``content_type``, size, duration and flags Discord already sends
+with every attachment, so nothing is downloaded and file names don't
+matter (``CLIP.MOV`` and ``clip.webm`` are both videos). Each attachment
+is classified once and the result is shared by every cog.
+"""
+
+import enum
+import mimetypes
+from typing import Optional
+
+import discord
+
+from bot.cogs.utils.cache import LRUCache
+
+
+class AttachmentKind(enum.Enum):
+    IMAGE = "image"
+    VIDEO = "video"
+    AUDIO = "audio"
+    VOICE = "voice"
+    TEXT = "text"
+    OTHER = "other"
+
+
+class AttachmentInfo:
+    """Classification of a single attachment."""
+
+    __slots__ = (
+        "kind",
+        "content_type",
+        "size",
+        "duration",
+        "width",
+        "height",
+        "spoiler",
+    )
+
+    def __init__(self, kind, content_type, size, duration, width, height, spoiler):
+        self.kind: AttachmentKind = kind
+        self.content_type: Optional[str] = content_type
+        self.size: int = size
+        self.duration: Optional[float] = duration
+        self.width: Optional[int] = width
+        self.height: Optional[int] = height
+        self.spoiler: bool = spoiler
+
+    @property
+    def is_image(self) -> bool:
+        return self.kind is AttachmentKind.IMAGE
+
+    @property
+    def is_video(self) -> bool:
+        return self.kind is AttachmentKind.VIDEO
+
+    @property
+    def is_voice(self) -> bool:
+        return self.kind is AttachmentKind.VOICE
+
+    @property
+    def extension(self) -> Optional[str]:
+        """File extension matching the content type, e.g. ``"png"``."""
+        if not self.content_type:
+            return None
+        ext = mimetypes.guess_extension(self.content_type)
+        return ext[1:] if ext else None
+
+    def __repr__(self):
+        return (
+            f"<AttachmentInfo kind={self.kind.value} content_type={self.content_type!r} "
+            f"size={self.size}>"
+        )
+
+
+_cache = LRUCache(maxsize=2048)
+
+
+def _kind_from_content_type(content_type: Optional[str]) -> AttachmentKind:
+    if not content_type:
+        return AttachmentKind.OTHER
+
+    major = content_type.split("/", 1)[0]
+    try:
+        return AttachmentKind(major)
+    except ValueError:
+        return AttachmentKind.OTHER
+
+
+def classify(attachment: discord.Attachment) -> AttachmentInfo:
+    """Classify ``attachment`` from its metadata, cached by attachment id."""
+    info = _cache.get(attachment.id)
+    if info is not None:
+        return info
+
+    # drop parameters like "; charset=utf-8"
+    content_type = attachment.content_type
+    if content_type:
+        content_type = content_type.split(";", 1)[0].strip().lower()
+    else:
+        # very old or third party payloads, fall back to the (case insensitive) name
+        content_type, _ = mimetypes.guess_type(attachment.filename.lower())
+
+    if attachment.is_voice_message():
+        kind = AttachmentKind.VOICE
+    else:
+        kind = _kind_from_content_type(content_type)
+
+    info = AttachmentInfo(
+        kind,
+        content_type,
+        attachment.size,
+        attachment.duration,
+        attachment.width,
+        attachment.height,
+        attachment.is_spoiler(),
+    )
+    _cache.set(attachment.id, info)
+    return info
+
+
+def has_kind(msg: discord.Message, *kinds: AttachmentKind) -> bool:
+    """Whether any attachment of ``msg`` is one of ``kinds``."""
+    return any(classify(a).kind in kinds for a in msg.attachments)
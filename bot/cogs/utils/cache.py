@@ -0,0 +1,157 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRUCache:
+    """A size bounded mapping that forgets the least recently used keys first.
+
+    Entries optionally expire ``ttl`` seconds after they were set.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+        # metrics
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, *, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"<LRUCache size={len(self)} maxsize={self.maxsize} ttl={self.ttl}>"
+
+
+class CoalescingCache:
+    """Caches the results of coroutines in an ``LRUCache``.
+
+    Concurrent misses for the same key share a single call instead of each
+    making their own. Tracks how much waiting the cache saved its callers.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = None):
+        # key -> (value, seconds it took to compute)
+        self.cache = LRUCache(maxsize, ttl)
+        # key -> (future of the running call, when it started)
+        self._inflight: Dict[Hashable, Tuple[asyncio.Future, float]] = {}
+
+        # metrics
+        self.coalesced = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.cache.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        value, took = entry
+        self.saved_seconds += took
+        return value
+
+    def set(self, key: Hashable, value: Any, took: float):
+        """Store a value computed elsewhere, ``took`` seconds to get."""
+        self.cache.set(key, (value, took))
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        *,
+        store: bool = True,
+    ) -> Any:
+        """With ``store=False`` only concurrent calls share a result."""
+        if store:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            future, started = inflight
+            self.coalesced += 1
+            # the time already spent on the call is time this caller doesn't wait
+            self.saved_seconds += time.perf_counter() - started
+            # a cancelled waiter mustn't cancel the call for everyone else
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        self._inflight[key] = (future, started)
+        try:
+            value = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # retrieved, no warning when nobody else was waiting for it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        if store:
+            self.set(key, value, time.perf_counter() - started)
+        future.set_result(value)
+        return value
+
+    @property
+    def requests(self) -> int:
+        return self.cache.hits + self.cache.misses
+
+    @property
+    def hit_ratio(self) -> float:
+        """Share of requests answered without a call of their own."""
+        requests = self.requests
+        return (self.cache.hits + self.coalesced) / requests if requests else 0.0
+
+    def clear(self):
+        self.cache.clear()
+
+    def __len__(self):
+        return len(self.cache)
@@ -0,0 +1,177 @@
+"""Async client for the OpenAI completions API.
+
+Requests go through the bot's shared aiohttp session, so connections are
+pooled and nothing blocks the event loop. Completions are either read
+whole or streamed as server-sent events. Rate limits, server errors and
+network failures are retried with exponential backoff and full jitter,
+honouring ``Retry-After`` when the API sends one.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiohttp
+
+from bot.cogs.utils.queues import backoff_delay
+from bot.exceptions import CompletionFailed
+
+log = logging.getLogger(__name__)
+
+
+class Completion:
+    """Generated text and the tokens it cost."""
+
+    __slots__ = ("text", "prompt_tokens", "completion_tokens")
+
+    def __init__(self, text: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any]) -> "Completion":
+        usage = data.get("usage") or {}
+        return cls(
+            data["choices"][0]["text"],
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+        )
+
+
+class CompletionClient:
+    def __init__(
+        self,
+        bot,
+        api_key: str,
+        *,
+        base_url: str = "https://api.openai.com/v1",
+        timeout: float = 30.0,
+        retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 20.0,
+    ):
+        self.bot = bot
+        self.api_key = api_key
+        self.url = f"{base_url.rstrip('/')}/completions"
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # a stream may take longer than that, as long as chunks keep coming
+        self.stream_timeout = aiohttp.ClientTimeout(
+            sock_connect=timeout, sock_read=timeout
+        )
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def payload(
+        self,
+        *,
+        prompt: str,
+        model: str,
+        max_tokens: int,
+        stop: Optional[str] = None,
+        temperature: float = 0.7,
+        top_p: float = 1,
+        frequency_penalty: float = 0,
+        presence_penalty: float = 0,
+    ) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            "frequency_penalty": frequency_penalty,
+            "presence_penalty": presence_penalty,
+        }
+        if stop is not None:
+            payload["stop"] = [stop]
+        return payload
+
+    async def _open(
+        self, payload: Dict[str, Any], timeout: aiohttp.ClientTimeout
+    ) -> aiohttp.ClientResponse:
+        """POST ``payload`` until it succeeds, the response has to be released.
+
+        Raises CompletionFailed for errors that won't go away by retrying
+        and once the retries are used up.
+        """
+        for attempt in range(self.retries + 1):
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+            try:
+                resp = await self.bot.session.post(
+                    self.url, json=payload, headers=self.headers, timeout=timeout
+                )
+                if resp.status == 200:
+                    return resp
+
+                async with resp:
+                    body = await resp.text()
+                if resp.status != 429 and resp.status < 500:
+                    raise CompletionFailed(
+                        f"Completion request failed ({resp.status}): {body[:200]}"
+                    )
+
+                retry_after = resp.headers.get("Retry-After")
+                if retry_after is not None:
+                    try:
+                        delay = min(float(retry_after), self.max_delay)
+                    except ValueError:
+                        pass
+                error = f"status {resp.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+
+            if attempt < self.retries:
+                log.info(
+                    "Completion attempt %s failed (%s), retrying in %.1fs",
+                    attempt + 1,
+                    error,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+        raise CompletionFailed(f"Completion request failed after retries: {error}")
+
+    async def complete(self, **kwargs) -> Completion:
+        """Generate a completion, takes the arguments of ``payload``."""
+        resp = await self._open(self.payload(**kwargs), self.timeout)
+        try:
+            async with resp:
+                data = await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise CompletionFailed(f"Failed to read completion: {e!r}") from e
+        return Completion.from_response(data)
+
+    async def stream(self, **kwargs) -> AsyncIterator[str]:
+        """Generate a completion, yielding the text as it arrives."""
+        payload = self.payload(**kwargs)
+        payload["stream"] = True
+
+        resp = await self._open(payload, self.stream_timeout)
+        async with resp:
+            try:
+                # server-sent events, one "data: {json}" line per chunk
+                async for line in resp.content:
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+
+                    chunk = json.loads(data)
+                    text = chunk["choices"][0].get("text")
+                    if text:
+                        yield text
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # part of it may be on screen already, don't start over
+                raise CompletionFailed(f"Completion stream broke off: {e!r}") from e
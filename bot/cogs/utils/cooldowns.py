@@ -0,0 +1,267 @@
+"""Shared, bounded-memory cooldowns.
+
+Replaces module-global ``CooldownMapping`` objects, which keep a bucket for
+every member that ever triggered them. Each limiter here is a GCRA
+(generic cell rate algorithm) store: a bucket is a single float, the
+theoretical arrival time (TAT) of the next request. A bucket whose TAT is in
+the past is indistinguishable from a fresh one, so idle buckets are dropped
+by a timer wheel and the number of live buckets is capped per limiter.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from discord.ext import tasks
+from discord.ext.commands import BucketType
+
+log = logging.getLogger(__name__)
+
+
+def _freeze_key(key):
+    """Mongo hands tuples back as lists, turn them into hashable tuples again."""
+    if isinstance(key, list):
+        return tuple(_freeze_key(k) for k in key)
+    return key
+
+
+class RateLimiter:
+    """Allows ``rate`` uses per ``per`` seconds for each bucket key."""
+
+    def __init__(
+        self,
+        registry: "CooldownRegistry",
+        name: str,
+        rate: int,
+        per: float,
+        type: BucketType,
+        capacity: int,
+    ):
+        self.registry = registry
+        self.name = name
+        self.rate = rate
+        self.per = per
+        self.type = type
+        self.capacity = capacity
+
+        self.emission_interval = per / rate
+        # how far ahead of "now" the TAT may run before requests get limited
+        self.tolerance = per - self.emission_interval
+
+        self._buckets: "OrderedDict[Any, float]" = OrderedDict()
+
+        # metrics
+        self.allowed = 0
+        self.limited = 0
+        self.evicted_full = 0
+        self.evicted_idle = 0
+
+    def get_key(self, msg) -> Any:
+        return self.type.get_key(msg)
+
+    def update_rate_limit(
+        self, msg, current: Optional[float] = None
+    ) -> Optional[float]:
+        """Consume one use for ``msg``'s bucket.
+
+        Returns the seconds to wait if the bucket is exhausted, otherwise ``None``.
+        Same contract as ``Cooldown.update_rate_limit``.
+        """
+        now = current or time.time()
+        key = self.get_key(msg)
+        buckets = self._buckets
+
+        tat = max(buckets.get(key, now), now)
+        retry_after = tat - now - self.tolerance
+        if retry_after > 0:
+            self.limited += 1
+            return retry_after
+
+        tat += self.emission_interval
+        buckets[key] = tat
+        buckets.move_to_end(key)
+        self.allowed += 1
+
+        if len(buckets) > self.capacity:
+            # drop the least recently used bucket, worst case that member gets a fresh limit
+            buckets.popitem(last=False)
+            self.evicted_full += 1
+
+        self.registry.wheel.schedule(self, key, tat)
+        return None
+
+    def get_retry_after(self, msg, current: Optional[float] = None) -> float:
+        """Seconds until ``msg``'s bucket allows another use, without consuming it."""
+        now = current or time.time()
+        tat = self._buckets.get(self.get_key(msg))
+        if tat is None:
+            return 0.0
+        return max(tat - now - self.tolerance, 0.0)
+
+    def reset(self, msg):
+        self._buckets.pop(self.get_key(msg), None)
+
+    def expire(self, key, now: float) -> Optional[float]:
+        """Drop ``key`` if its bucket is idle, otherwise return its TAT."""
+        tat = self._buckets.get(key)
+        if tat is None:
+            return None
+        if tat <= now:
+            del self._buckets[key]
+            self.evicted_idle += 1
+            return None
+        return tat
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def __repr__(self):
+        return f"<RateLimiter name={self.name!r} rate={self.rate} per={self.per} size={len(self)}>"
+
+
+class TimerWheel:
+    """Hashed timer wheel that evicts buckets once their TAT has passed.
+
+    Each slot covers ``resolution`` seconds. Deadlines further away than a
+    full revolution are simply re-scheduled when their slot comes round.
+    """
+
+    def __init__(self, slots: int, resolution: float):
+        self.resolution = resolution
+        self._slots: List[Set[Tuple[RateLimiter, Any]]] = [set() for _ in range(slots)]
+        self._last_tick: Optional[int] = None
+
+    def _index(self, deadline: float) -> int:
+        # the slot after the deadline's, so it has passed by the time it's swept
+        return (int(deadline // self.resolution) + 1) % len(self._slots)
+
+    def schedule(self, limiter: RateLimiter, key, deadline: float):
+        self._slots[self._index(deadline)].add((limiter, key))
+
+    def advance(self, now: Optional[float] = None):
+        """Sweep every slot whose time has come since the previous call."""
+        now = now or time.time()
+        tick = int(now // self.resolution)
+        last = tick - 1 if self._last_tick is None else self._last_tick
+
+        # never sweep more than one revolution, even after a long stall
+        start = max(last + 1, tick - len(self._slots) + 1)
+        for t in range(start, tick + 1):
+            slot = self._slots[t % len(self._slots)]
+            entries = list(slot)
+            slot.clear()
+            for limiter, key in entries:
+                tat = limiter.expire(key, now)
+                if tat is not None:
+                    self.schedule(limiter, key, tat)
+
+        self._last_tick = tick
+
+    def __len__(self):
+        return sum(len(s) for s in self._slots)
+
+
+class CooldownRegistry:
+    """Owns every limiter of the bot, their eviction and their snapshots."""
+
+    def __init__(
+        self,
+        *,
+        capacity: int = 10_000,
+        resolution: float = 5.0,
+        slots: int = 720,
+    ):
+        self.capacity = capacity
+        self.limiters: Dict[str, RateLimiter] = {}
+        self.wheel = TimerWheel(slots, resolution)
+        self.sweeper.change_interval(seconds=resolution)
+
+    def limiter(
+        self,
+        name: str,
+        rate: int,
+        per: float,
+        type: BucketType = BucketType.default,
+        *,
+        capacity: Optional[int] = None,
+    ) -> RateLimiter:
+        """Get or create the limiter called ``name``.
+
+        Getting an existing limiter keeps its buckets, so reloading a cog
+        doesn't reset everyone's cooldowns.
+        """
+        limiter = self.limiters.get(name)
+        config = (rate, per, type)
+        if limiter is None or (limiter.rate, limiter.per, limiter.type) != config:
+            limiter = RateLimiter(
+                self, name, rate, per, type, capacity or self.capacity
+            )
+            self.limiters[name] = limiter
+        return limiter
+
+    @tasks.loop(seconds=5)
+    async def sweeper(self):
+        self.wheel.advance()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": limiter.name,
+                "size": len(limiter),
+                "capacity": limiter.capacity,
+                "allowed": limiter.allowed,
+                "limited": limiter.limited,
+                "evicted_full": limiter.evicted_full,
+                "evicted_idle": limiter.evicted_idle,
+            }
+            for limiter in self.limiters.values()
+        ]
+
+    # persistence
+
+    def snapshot(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Live buckets of every limiter, idle ones are left out."""
+        now = now or time.time()
+        return [
+            {
+                "_id": limiter.name,
+                "buckets": [
+                    [k, tat] for k, tat in limiter._buckets.items() if tat > now
+                ],
+            }
+            for limiter in self.limiters.values()
+        ]
+
+    def restore(self, documents, now: Optional[float] = None):
+        """Load buckets saved by :meth:`snapshot` into limiters that already exist."""
+        now = now or time.time()
+        restored = 0
+        for doc in documents:
+            limiter = self.limiters.get(doc["_id"])
+            if limiter is None:
+                continue
+
+            for key, tat in doc["buckets"]:
+                if tat <= now:
+                    continue
+                key = _freeze_key(key)
+                limiter._buckets[key] = tat
+                self.wheel.schedule(limiter, key, tat)
+                restored += 1
+
+            while len(limiter._buckets) > limiter.capacity:
+                limiter._buckets.popitem(last=False)
+
+        return restored
+
+    async def save(self, collection):
+        """Save a snapshot of every limiter to the database."""
+        for doc in self.snapshot():
+            await collection.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+
+    async def load(self, collection):
+        """Load the last snapshot from the database."""
+        documents = await collection.find({}).to_list(None)
+        restored = self.restore(documents)
+        log.info("Restored %s cooldown buckets", restored)
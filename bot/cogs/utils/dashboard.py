@@ -0,0 +1,80 @@
+"""Staff messages that always show the current state of something.
+
+A ``LiveMessage`` is marked stale whenever its state changes and edited
+at most once per interval, however many changes happened in between.
+The message id is stored so the same message keeps being edited across
+restarts, a new one is only sent when it got deleted.
+"""
+
+import logging
+from typing import Callable, Optional
+
+import discord
+from discord.ext import tasks
+
+log = logging.getLogger(__name__)
+
+
+class LiveMessage:
+    """One message rendered by ``render()``, kept up to date at a bounded rate."""
+
+    def __init__(
+        self,
+        bot,
+        key: str,
+        channel_id: int,
+        render: Callable[[], discord.Embed],
+        *,
+        interval: float = 10.0,
+    ):
+        self.bot = bot
+        self.key = key
+        self.channel_id = channel_id
+        self.render = render
+        self.message_id: Optional[int] = None
+        self.stale = True
+        self.refresher.change_interval(seconds=interval)
+
+    async def load(self):
+        doc = await self.bot.live_messages.find_one({"_id": self.key})
+        if doc and doc["channel_id"] == self.channel_id:
+            self.message_id = doc["message_id"]
+
+    def invalidate(self):
+        self.stale = True
+
+    async def refresh(self):
+        channel = self.bot.get_channel(self.channel_id)
+        if channel is None:
+            return
+        self.stale = False
+        embed = self.render()
+
+        if self.message_id is not None:
+            try:
+                await channel.get_partial_message(self.message_id).edit(embed=embed)
+                return
+            except discord.NotFound:
+                pass  # deleted, send a new one
+
+        message = await channel.send(embed=embed)
+        self.message_id = message.id
+        await self.bot.live_messages.replace_one(
+            {"_id": self.key},
+            {"_id": self.key, "channel_id": channel.id, "message_id": message.id},
+            upsert=True,
+        )
+
+    @tasks.loop(seconds=10)
+    async def refresher(self):
+        if not self.stale:
+            return
+        try:
+            await self.refresh()
+        except discord.HTTPException as e:
+            self.stale = True
+            log.warning("Failed to update live message %s: %s", self.key, e)
+
+    @refresher.before_loop
+    async def before_refresher(self):
+        await self.bot.wait_until_ready()
@@ -0,0 +1,102 @@
+"""Persistent deadlines served by a single task.
+
+Deadlines are kept in a heap and one task sleeps until the earliest of
+them, waking up early when a sooner one is scheduled. Every deadline is
+also stored in MongoDB so pending ones survive restarts: after ``load``
+they fire as planned, or right away if they passed while the bot was
+down.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class DeadlineScheduler:
+    """Awaits ``callback(key, data)`` once the deadline of ``key`` has passed."""
+
+    def __init__(self, collection, callback: Callable[[Any, dict], Awaitable]):
+        self.collection = collection
+        self.callback = callback
+        # (when, key), entries of cancelled or rescheduled keys are skipped
+        self._heap: List[Tuple[float, Any]] = []
+        # key -> (when, data)
+        self._deadlines: Dict[Any, Tuple[float, dict]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def get(self, key) -> Optional[dict]:
+        entry = self._deadlines.get(key)
+        return entry[1] if entry is not None else None
+
+    def _push(self, key, when: float, data: dict):
+        self._deadlines[key] = (when, data)
+        heapq.heappush(self._heap, (when, key))
+        if self._heap[0][1] == key:
+            # sooner than what the runner is sleeping for
+            self._wakeup.set()
+
+    async def load(self):
+        async for doc in self.collection.find():
+            self._push(doc["_id"], doc["when"], doc.get("data", {}))
+
+    async def schedule(self, key, when: float, **data):
+        """Fire at unix time ``when``, replacing any deadline of ``key``."""
+        self._push(key, when, data)
+        await self.collection.replace_one(
+            {"_id": key}, {"_id": key, "when": when, "data": data}, upsert=True
+        )
+
+    async def cancel(self, key) -> bool:
+        if self._deadlines.pop(key, None) is None:
+            return False
+        await self.collection.delete_one({"_id": key})
+        return True
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _fire(self, key, data: dict):
+        try:
+            await self.callback(key, data)
+        except Exception:
+            log.exception("Deadline callback failed for %r", key)
+
+        try:
+            await self.collection.delete_one({"_id": key})
+        except Exception as e:
+            log.warning("Failed to remove deadline %r: %s", key, e)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                when, key = heapq.heappop(self._heap)
+                entry = self._deadlines.get(key)
+                if entry is None or entry[0] != when:
+                    continue
+                del self._deadlines[key]
+                await self._fire(key, entry[1])
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
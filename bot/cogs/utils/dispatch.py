@@ -0,0 +1,254 @@
+"""Central message dispatch pipeline.
+
+Every message is classified exactly once (guild, channel class, prefix,
+attachments, links) and then handed to the handlers registered for its
+channel class, in order. Cogs register handlers with the bot's dispatcher
+instead of adding their own ``on_message`` listeners.
+"""
+
+import enum
+import logging
+import re
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+log = logging.getLogger(__name__)
+
+LINK_RE = re.compile(r"https?://\S", re.IGNORECASE)
+
+# channel class used for direct messages
+DM_CLASS = "dm"
+
+
+class MessageFlags(enum.IntFlag):
+    NONE = 0
+    ATTACHMENTS = 1
+    LINK = 2
+
+
+class MessageInfo:
+    """Everything the handlers need to know about a message, computed once."""
+
+    __slots__ = ("guild_id", "channel_id", "channel_class", "prefix", "flags")
+
+    def __init__(self, guild_id, channel_id, channel_class, prefix, flags):
+        self.guild_id: Optional[int] = guild_id
+        self.channel_id: int = channel_id
+        self.channel_class: Optional[str] = channel_class
+        self.prefix: Optional[str] = prefix
+        self.flags: MessageFlags = flags
+
+    def __repr__(self):
+        return (
+            f"<MessageInfo guild_id={self.guild_id} channel_id={self.channel_id} "
+            f"channel_class={self.channel_class!r} prefix={self.prefix!r} flags={self.flags!r}>"
+        )
+
+
+HandlerCallback = Callable[[discord.Message, MessageInfo], Awaitable[None]]
+
+
+class MessageHandler:
+    """A registered handler and the classes of messages it wants to see."""
+
+    __slots__ = ("callback", "name", "guild_id", "prefix", "flags", "priority", "seq")
+
+    def __init__(self, callback, *, guild_id, prefix, flags, priority, seq):
+        self.callback: HandlerCallback = callback
+        self.name: str = callback.__qualname__
+        self.guild_id: Optional[int] = guild_id
+        self.prefix: Optional[str] = prefix
+        self.flags: MessageFlags = flags
+        self.priority: int = priority
+        self.seq: int = seq
+
+    def wants(self, info: MessageInfo) -> bool:
+        if self.guild_id is not None and self.guild_id != info.guild_id:
+            return False
+        if self.prefix is not None and self.prefix != info.prefix:
+            return False
+        # flags are "any of", e.g. ATTACHMENTS | LINK matches either
+        if self.flags and not self.flags & info.flags:
+            return False
+        return True
+
+
+class StageTiming:
+    """Call count and cumulative/max duration of one pipeline stage."""
+
+    __slots__ = ("calls", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, elapsed_ns: int):
+        self.calls += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+
+    @property
+    def avg_us(self) -> float:
+        return self.total_ns / self.calls / 1000 if self.calls else 0.0
+
+    @property
+    def max_us(self) -> float:
+        return self.max_ns / 1000
+
+
+class MessageDispatcher:
+    """Classifies messages and routes them to registered handlers."""
+
+    def __init__(self):
+        # channel id -> channel class
+        self._channel_classes: Dict[int, str] = {}
+        # channel class (None = every guild channel) -> handlers
+        self._handlers: Dict[Optional[str], List[MessageHandler]] = {}
+        # channel class -> ordered handlers to run, rebuilt on (un)registration
+        self._routes: Dict[Optional[str], Tuple[MessageHandler, ...]] = {}
+        self._default_route: Tuple[MessageHandler, ...] = ()
+        self._prefixes: Tuple[str, ...] = ()
+        self._seq = 0
+        self.timings: Dict[str, StageTiming] = {}
+
+    # configuration
+
+    def add_channel_class(self, channel_class: str, channel_ids: Iterable[int]):
+        """Assign a class to a set of channels, e.g. "media" for the media channels."""
+        for channel_id in channel_ids:
+            if channel_id is None:
+                continue
+            current = self._channel_classes.get(channel_id)
+            if current is not None and current != channel_class:
+                log.warning(
+                    "Channel %s reassigned from class %r to %r",
+                    channel_id,
+                    current,
+                    channel_class,
+                )
+            self._channel_classes[channel_id] = channel_class
+
+    def register(
+        self,
+        callback: HandlerCallback,
+        *,
+        channel_class: Optional[str] = None,
+        guild_id: Optional[int] = None,
+        prefix: Optional[str] = None,
+        flags: MessageFlags = MessageFlags.NONE,
+        priority: int = 0,
+    ) -> MessageHandler:
+        """Register a coroutine called with ``(message, info)``.
+
+        ``channel_class=None`` receives messages from every guild channel,
+        direct messages are only delivered to the ``"dm"`` class. Handlers
+        run in ``priority`` order, then registration order.
+        """
+        self._seq += 1
+        handler = MessageHandler(
+            callback,
+            guild_id=guild_id,
+            prefix=prefix,
+            flags=flags,
+            priority=priority,
+            seq=self._seq,
+        )
+        self._handlers.setdefault(channel_class, []).append(handler)
+        self._rebuild()
+        return handler
+
+    def unregister(self, owner):
+        """Remove every handler bound to ``owner``, usually a cog being unloaded."""
+        for channel_class, handlers in list(self._handlers.items()):
+            handlers[:] = [
+                h
+                for h in handlers
+                if getattr(h.callback, "__self__", None) is not owner
+            ]
+            if not handlers:
+                del self._handlers[channel_class]
+        self._rebuild()
+
+    def _rebuild(self):
+        def ordered(handlers):
+            return tuple(sorted(handlers, key=lambda h: (h.priority, h.seq)))
+
+        global_handlers = self._handlers.get(None, [])
+        self._routes = {
+            channel_class: ordered(
+                handlers + ([] if channel_class == DM_CLASS else global_handlers)
+            )
+            for channel_class, handlers in self._handlers.items()
+            if channel_class is not None
+        }
+        # guild handlers never see direct messages
+        self._routes.setdefault(DM_CLASS, ())
+        self._default_route = ordered(global_handlers)
+        self._prefixes = tuple(
+            {h.prefix for hs in self._handlers.values() for h in hs if h.prefix}
+        )
+
+    # pipeline
+
+    def classify(self, message: discord.Message) -> MessageInfo:
+        channel = message.channel
+        guild = message.guild
+
+        if guild is None:
+            channel_class = DM_CLASS
+            guild_id = None
+        else:
+            channel_class = self._channel_classes.get(channel.id)
+            guild_id = guild.id
+
+        content = message.content
+        prefix = None
+        for p in self._prefixes:
+            if content.startswith(p):
+                prefix = p
+                break
+
+        flags = MessageFlags.NONE
+        if message.attachments:
+            flags |= MessageFlags.ATTACHMENTS
+        if "http" in content and LINK_RE.search(content):
+            flags |= MessageFlags.LINK
+
+        return MessageInfo(guild_id, channel.id, channel_class, prefix, flags)
+
+    def route(self, info: MessageInfo) -> Tuple[MessageHandler, ...]:
+        if info.channel_class is None:
+            return self._default_route
+        return self._routes.get(info.channel_class, self._default_route)
+
+    async def dispatch(self, message: discord.Message):
+        """Classify ``message`` and run every handler interested in it."""
+        start = time.perf_counter_ns()
+        info = self.classify(message)
+        handlers = self.route(info)
+        self.record("classify", time.perf_counter_ns() - start)
+
+        for handler in handlers:
+            if not handler.wants(info):
+                continue
+
+            start = time.perf_counter_ns()
+            try:
+                await handler.callback(message, info)
+            except Exception:
+                log.exception("Message handler %s failed", handler.name)
+            finally:
+                self.record(handler.name, time.perf_counter_ns() - start)
+
+    def record(self, stage: str, elapsed_ns: int):
+        timing = self.timings.get(stage)
+        if timing is None:
+            timing = self.timings[stage] = StageTiming()
+        timing.add(elapsed_ns)
+
+    def reset_timings(self):
+        self.timings.clear()
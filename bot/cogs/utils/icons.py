@@ -0,0 +1,101 @@
+"""Fetching role icons from URLs.
+
+Downloads go through the bot's shared session, are streamed with a byte
+cap and a timeout, and are re-encoded in the process pool into a PNG that
+fits Discord's role icon limits, so neither an oversized file nor the
+decoding reaches the event loop. Results are cached per URL. Once an entry
+expires it's revalidated with its ETag instead of downloaded again.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+from bot.cogs.utils.cache import CoalescingCache, LRUCache
+from bot.cogs.utils.images import role_icon
+from bot.exceptions import IconUnavailable
+
+log = logging.getLogger(__name__)
+
+# discord rejects role icons above this
+ICON_MAX_BYTES = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class IconService:
+    def __init__(
+        self,
+        bot,
+        *,
+        max_download: int = 8 * 1024 * 1024,
+        size: int = 256,
+        timeout: float = 15.0,
+        cache_size: int = 128,
+        cache_ttl: Optional[float] = 3600,
+    ):
+        self.bot = bot
+        self.max_download = max_download
+        self.size = size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # url -> icon, served without asking the host
+        self.fresh = CoalescingCache(cache_size, cache_ttl)
+        # url -> (etag, icon), for revalidating expired entries
+        self.tagged = LRUCache(cache_size)
+
+    async def get(self, url: str) -> bytes:
+        """The PNG role icon made from the image at ``url``.
+
+        Raises IconUnavailable with a message fit for the user when the
+        image can't be used.
+        """
+        return await self.fresh.get_or_compute(url, lambda: self._fetch(url))
+
+    async def _fetch(self, url: str) -> bytes:
+        tagged = self.tagged.get(url)
+        headers = {"If-None-Match": tagged[0]} if tagged is not None else {}
+
+        try:
+            async with self.bot.session.get(
+                url, headers=headers, timeout=self.timeout
+            ) as resp:
+                if resp.status == 304 and tagged is not None:
+                    return tagged[1]
+                if resp.status != 200:
+                    raise IconUnavailable(
+                        f"Couldn't download the icon (HTTP {resp.status})."
+                    )
+                if not resp.content_type.startswith("image/"):
+                    raise IconUnavailable("The icon URL doesn't point to an image.")
+                if (resp.content_length or 0) > self.max_download:
+                    raise IconUnavailable(self._too_large())
+
+                data = bytearray()
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    data += chunk
+                    if len(data) > self.max_download:
+                        raise IconUnavailable(self._too_large())
+                etag = resp.headers.get("ETag")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.info("Failed to download icon %s: %r", url, e)
+            raise IconUnavailable("Couldn't download the icon.") from e
+
+        try:
+            icon = await self.bot.run_in_process(
+                role_icon, bytes(data), self.size, ICON_MAX_BYTES
+            )
+        except Exception as e:
+            log.info("Failed to convert icon %s: %s", url, e)
+            raise IconUnavailable("The icon isn't a usable PNG, JPEG, GIF or WEBP.")
+
+        if etag is not None:
+            self.tagged.set(url, (etag, icon))
+        return icon
+
+    def _too_large(self) -> str:
+        return f"The icon must be smaller than {self.max_download // 1024 // 1024}MB."
+
+    def clear(self):
+        self.fresh.clear()
+        self.tagged.clear()
@@ -0,0 +1,67 @@
+"""Image processing meant to run in the bot's process pool.
+
+Everything here is plain functions of bytes, so they can be pickled to
+a worker process with ``bot.run_in_process`` and never block the event
+loop while decoding.
+"""
+
+import io
+
+from PIL import Image, ImageOps
+
+# refuse decompression bombs before decoding them
+MAX_PIXELS = 64_000_000
+
+
+def review_copy(data: bytes, max_size: int, quality: int = 85) -> bytes:
+    """A JPEG of the image scaled to fit ``max_size``, without any metadata."""
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width * image.height > MAX_PIXELS:
+            raise ValueError(f"image too large ({image.width}x{image.height})")
+
+        # lets JPEGs decode at a reduced scale straight away
+        image.draft("RGB", (max_size, max_size))
+        # apply the camera orientation before the EXIF data is dropped
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        # a freshly encoded JPEG only carries what's passed to save
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=quality, optimize=True)
+        return out.getvalue()
+
+
+# formats accepted as role icons, whatever the URL or content type claims
+ICON_FORMATS = {"PNG", "JPEG", "GIF", "WEBP"}
+
+
+def role_icon(data: bytes, size: int, max_bytes: int) -> bytes:
+    """A PNG of the image's first frame, at most ``size`` pixels a side.
+
+    Halves the size until the PNG fits in ``max_bytes``.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format not in ICON_FORMATS:
+            raise ValueError(f"unsupported image format {image.format}")
+        if image.width * image.height > MAX_PIXELS:
+            raise ValueError(f"image too large ({image.width}x{image.height})")
+
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+
+        while True:
+            icon = image.copy()
+            icon.thumbnail((size, size))
+            out = io.BytesIO()
+            icon.save(out, "PNG", optimize=True)
+            if out.tell() <= max_bytes or size <= 32:
+                break
+            size //= 2
+
+        if out.tell() > max_bytes:
+            raise ValueError("icon doesn't fit the size limit")
+        return out.getvalue()
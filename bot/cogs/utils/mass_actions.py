@@ -0,0 +1,165 @@
+"""Acting on many members at once, e.g. during a raid.
+
+Bans go through ``Guild.bulk_ban`` (200 users per request) when the
+library supports it, everything else runs with bounded concurrency.
+Progress is reported in a single staff message that is edited in place
+at a bounded rate instead of one message per account.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+log = logging.getLogger(__name__)
+
+BULK_BAN_LIMIT = 200
+
+
+class ProgressReport:
+    """A staff message summarising a mass action, edited as it progresses."""
+
+    def __init__(
+        self, channel: discord.abc.Messageable, title: str, *, min_interval=2.0
+    ):
+        self.channel = channel
+        self.title = title
+        self.min_interval = min_interval
+        self.message: Optional[discord.Message] = None
+        # label -> [pending, done, failed]
+        self.counts: Dict[str, List[int]] = {}
+        self._last_edit = 0.0
+        self._lock = asyncio.Lock()
+
+    def queue(self, label: str, count: int):
+        self.counts.setdefault(label, [0, 0, 0])[0] += count
+
+    def add(self, label: str, *, done: int = 0, failed: int = 0):
+        counts = self.counts.setdefault(label, [0, 0, 0])
+        counts[0] = max(counts[0] - done - failed, 0)
+        counts[1] += done
+        counts[2] += failed
+
+    def render(self) -> str:
+        lines = [self.title]
+        for label, (pending, done, failed) in self.counts.items():
+            line = f"**{label}**: {done}"
+            if pending:
+                line += f", {pending} pending"
+            if failed:
+                line += f", {failed} failed"
+            lines.append(line)
+        return "\n".join(lines)[:2000]
+
+    async def update(self, *, force: bool = False):
+        """Send or edit the message, at most once every ``min_interval`` seconds."""
+        now = time.monotonic()
+        if not force and now - self._last_edit < self.min_interval:
+            return
+        self._last_edit = now
+
+        # one send, never two messages for the same report
+        async with self._lock:
+            try:
+                if self.message is None:
+                    self.message = await self.channel.send(self.render())
+                else:
+                    await self.message.edit(content=self.render())
+            except discord.HTTPException as e:
+                log.warning("Failed to update mass action report: %s", e)
+
+
+async def run_bounded(
+    targets: Iterable,
+    action: Callable[..., Awaitable],
+    *,
+    concurrency: int = 5,
+    on_result: Optional[Callable[[object, Optional[Exception]], Awaitable]] = None,
+) -> Tuple[list, list]:
+    """Await ``action(target)`` for every target, ``concurrency`` at a time.
+
+    ``on_result(target, error)`` is awaited after each one. Returns
+    ``(succeeded, failed)`` lists of targets.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    succeeded, failed = [], []
+
+    async def run(target):
+        async with semaphore:
+            try:
+                await action(target)
+            except discord.HTTPException as e:
+                failed.append(target)
+                error = e
+            else:
+                succeeded.append(target)
+                error = None
+
+        if on_result is not None:
+            await on_result(target, error)
+
+    await asyncio.gather(*(run(t) for t in targets))
+    return succeeded, failed
+
+
+async def mass_ban(
+    guild: discord.Guild,
+    users: Iterable[discord.abc.Snowflake],
+    *,
+    reason: str,
+    delete_message_seconds: int = 24 * 60 * 60,
+    concurrency: int = 5,
+    report: Optional[ProgressReport] = None,
+    label: str = "Banned",
+) -> Tuple[List[int], List[int]]:
+    """Ban ``users``, returns ``(banned_ids, failed_ids)``."""
+    users = list(users)
+    banned: List[int] = []
+    failed: List[int] = []
+    fallback = []
+
+    if hasattr(guild, "bulk_ban"):
+        for i in range(0, len(users), BULK_BAN_LIMIT):
+            chunk = users[i : i + BULK_BAN_LIMIT]
+            try:
+                result = await guild.bulk_ban(
+                    chunk, reason=reason, delete_message_seconds=delete_message_seconds
+                )
+            except discord.HTTPException as e:
+                # e.g. missing manage_guild, which bulk bans need on top of ban_members
+                log.info("Bulk ban failed (%s), banning one by one", e)
+                fallback.extend(chunk)
+                continue
+
+            banned.extend(u.id for u in result.banned)
+            failed.extend(u.id for u in result.failed)
+            if report is not None:
+                report.add(label, done=len(result.banned), failed=len(result.failed))
+                await report.update()
+    else:
+        fallback = users
+
+    if fallback:
+
+        async def ban(user):
+            await guild.ban(
+                user, reason=reason, delete_message_seconds=delete_message_seconds
+            )
+
+        async def on_result(user, error):
+            if report is not None:
+                report.add(label, done=error is None, failed=error is not None)
+                await report.update()
+
+        ok, not_ok = await run_bounded(
+            fallback, ban, concurrency=concurrency, on_result=on_result
+        )
+        banned.extend(u.id for u in ok)
+        failed.extend(u.id for u in not_ok)
+
+    if report is not None:
+        await report.update(force=True)
+
+    return banned, failed
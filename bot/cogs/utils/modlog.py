@@ -0,0 +1,147 @@
+"""Append-only journal of moderation actions.
+
+Actions are buffered in memory and written to MongoDB in batches, so
+recording one never waits on the database. The collection has a TTL
+index for retention and a ``(guild_id, user_id, created_at)`` index so a
+member's history is a single indexed query.
+"""
+
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, List, Optional
+
+from discord.ext import tasks
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+
+log = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class ModLog:
+    """Write-behind journal of moderation actions."""
+
+    def __init__(
+        self,
+        collection,
+        *,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        max_pending: int = 10000,
+        retention_days: int = 180,
+    ):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self.flusher.change_interval(seconds=flush_interval)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            "created_at", expireAfterSeconds=self.retention_days * 24 * 60 * 60
+        )
+        await self.collection.create_index(
+            [
+                ("guild_id", ASCENDING),
+                ("user_id", ASCENDING),
+                ("created_at", DESCENDING),
+            ]
+        )
+
+    def record(
+        self,
+        action: str,
+        *,
+        guild_id: int,
+        user_id: int,
+        moderator_id: Optional[int] = None,
+        channel_id: Optional[int] = None,
+        reason: Optional[str] = None,
+    ):
+        """Queue an action, e.g. ``"timeout"``, ``"delete"`` or ``"ban"``."""
+        event = {
+            "guild_id": guild_id,
+            "user_id": user_id,
+            "action": action,
+            "created_at": datetime.datetime.utcnow(),
+        }
+        # keep the documents small, only store what's known
+        if moderator_id is not None:
+            event["moderator_id"] = moderator_id
+        if channel_id is not None:
+            event["channel_id"] = channel_id
+        if reason:
+            event["reason"] = reason[:512]
+
+        self._pending.append(event)
+        if len(self._pending) >= self.batch_size and (
+            self._flush_task is None or self._flush_task.done()
+        ):
+            # don't wait for the next tick when a burst fills the batch
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except asyncio.CancelledError:
+            # cancelled on shutdown, close() writes them
+            self._requeue(batch)
+            raise
+        except BulkWriteError as e:
+            # the rest was written. insert_many set the _ids, so a duplicate
+            # key means an earlier attempt already stored that event
+            failed = [
+                batch[error["index"]]
+                for error in e.details.get("writeErrors", [])
+                if error.get("code") != DUPLICATE_KEY
+            ]
+            self._requeue(failed)
+            log.warning("Failed to write %s mod log events: %s", len(failed), e)
+        except Exception as e:
+            # retried whole, events that did get written come back as duplicates
+            self._requeue(batch)
+            log.warning("Failed to write %s mod log events: %s", len(batch), e)
+
+    def _requeue(self, events: List[Dict[str, Any]]):
+        # put them back in front, they'll go out with the next batch
+        self._pending[:0] = events
+        dropped = len(self._pending) - self.max_pending
+        if dropped > 0:
+            del self._pending[:dropped]
+            log.warning("Dropped %s unwritten mod log events", dropped)
+
+    @tasks.loop(seconds=5)
+    async def flusher(self):
+        await self.flush()
+
+    async def history(
+        self, guild_id: int, user_id: int, *, limit: int = 15
+    ) -> List[Dict[str, Any]]:
+        """Latest actions against a user, newest first, including unflushed ones."""
+        pending = [
+            e
+            for e in reversed(self._pending)
+            if e["guild_id"] == guild_id and e["user_id"] == user_id
+        ]
+        stored = (
+            await self.collection.find({"guild_id": guild_id, "user_id": user_id})
+            .sort("created_at", DESCENDING)
+            .limit(limit)
+            .to_list(None)
+        )
+        return (pending + stored)[:limit]
+
+    async def close(self):
+        self.flusher.cancel()
+        # let a running flush finish before writing what's left
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
@@ -0,0 +1,153 @@
+"""Background work queue for Discord API calls that shouldn't block event handlers."""
+
+import asyncio
+import logging
+import random
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Hashable, List, Tuple
+
+import aiohttp
+import discord
+
+log = logging.getLogger(__name__)
+
+JobFactory = Callable[[], Awaitable[Any]]
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits, server errors and network hiccups are worth another try."""
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(maximum, base * 2**attempt))
+
+
+class WorkQueue:
+    """Runs jobs in the background, retrying transient failures with backoff.
+
+    Jobs are identified by a key, a key that is queued, running or recently
+    finished is not accepted again. With a single worker jobs run strictly in
+    submission order.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        workers: int = 1,
+        retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        remember: int = 1000,
+    ):
+        self.name = name
+        self.workers = workers
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.remember = remember
+
+        self._jobs: Deque[Tuple[Hashable, JobFactory]] = deque()
+        self._queued: set = set()
+        self._running: set = set()
+        self._done: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+        # metrics
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.duplicates = 0
+
+    def submit(self, key: Hashable, factory: JobFactory) -> bool:
+        """Queue ``factory()`` to be awaited in the background.
+
+        Returns ``False`` if a job with the same key was already accepted.
+        """
+        if self.is_known(key):
+            self.duplicates += 1
+            return False
+
+        self._jobs.append((key, factory))
+        self._queued.add(key)
+        self._wakeup.set()
+        self._ensure_workers()
+        return True
+
+    def is_known(self, key: Hashable) -> bool:
+        return key in self._queued or key in self._running or key in self._done
+
+    @property
+    def pending(self) -> int:
+        """Jobs queued or running."""
+        return len(self._jobs) + len(self._running)
+
+    def _ensure_workers(self):
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        while True:
+            if not self._jobs:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            key, factory = self._jobs.popleft()
+            self._queued.discard(key)
+            self._running.add(key)
+            try:
+                await self._run(key, factory)
+            finally:
+                self._running.discard(key)
+                self._done[key] = None
+                if len(self._done) > self.remember:
+                    self._done.popitem(last=False)
+
+    async def _run(self, key: Hashable, factory: JobFactory):
+        for attempt in range(self.retries + 1):
+            try:
+                await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < self.retries and is_retryable(e):
+                    self.retried += 1
+                    delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                    log.info(
+                        "%s job %s failed (%s), retrying in %.1fs",
+                        self.name,
+                        key,
+                        e,
+                        delay,
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+
+                self.failed += 1
+                log.warning("%s job %s failed: %s", self.name, key, e)
+                return
+            else:
+                self.completed += 1
+                return
+
+    async def stop(self):
+        """Cancel the workers, queued jobs are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._jobs.clear()
+        self._queued.clear()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __repr__(self):
+        return f"<WorkQueue name={self.name!r} queued={len(self)} running={len(self._running)}>"
@@ -0,0 +1,168 @@
+"""Streaming raid detection over member joins.
+
+Every join is scored from cheap features (account age, default avatar,
+how many recent joiners share its name skeleton) and pushed into a set of
+sliding windows. Each window keeps a deque of joins and a running count of
+suspicious ones, so a join costs O(1) amortized work per window no matter
+how busy the server is. When a window holds more suspicious joins than
+its threshold the detector escalates: quarantine, then kick, then ban.
+Joins that don't look suspicious are never acted upon.
+"""
+
+import datetime
+import enum
+import re
+import time
+import unicodedata
+from collections import Counter, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+NON_LETTERS = re.compile(r"[^a-z]")
+
+
+class RaidAction(enum.IntEnum):
+    NONE = 0
+    QUARANTINE = 1
+    KICK = 2
+    BAN = 3
+
+
+def name_skeleton(name: str) -> str:
+    """Lowercase ascii letters of a name, so "Raider_123" and "raider456" match."""
+    normalized = unicodedata.normalize("NFKD", name).casefold()
+    return NON_LETTERS.sub("", normalized) or normalized
+
+
+class JoinEvent:
+    __slots__ = ("member", "timestamp", "skeleton", "score")
+
+    def __init__(self, member, timestamp, skeleton, score):
+        self.member: discord.Member = member
+        self.timestamp: float = timestamp
+        self.skeleton: str = skeleton
+        self.score: int = score
+
+
+class JoinWindow:
+    """Joins of the last ``seconds`` seconds and how many of them are suspicious."""
+
+    __slots__ = ("seconds", "threshold", "events", "suspicious")
+
+    def __init__(self, seconds: float, threshold: int):
+        self.seconds = seconds
+        self.threshold = threshold
+        self.events: Deque[JoinEvent] = deque()
+        self.suspicious = 0
+
+    @property
+    def pressure(self) -> float:
+        return self.suspicious / self.threshold
+
+
+class RaidDetector:
+    """Scores joins and decides which members to act on, without any I/O."""
+
+    def __init__(
+        self,
+        windows: Iterable[Tuple[float, int]],
+        *,
+        min_score: int = 2,
+        new_account_days: int = 7,
+        escalation: Iterable[float] = (1, 2, 3),
+    ):
+        self.windows = sorted(
+            (JoinWindow(seconds, joins) for seconds, joins in windows),
+            key=lambda w: w.seconds,
+        )
+        # the longest window also tracks names and acted upon members
+        self._longest = self.windows[-1]
+        self.min_score = min_score
+        self.new_account_age = datetime.timedelta(days=new_account_days)
+        # pressure needed for each action, in RaidAction order
+        self.escalation = list(escalation)
+
+        self.level = RaidAction.NONE
+        self._names: Counter = Counter()
+        self._actioned: Dict[int, RaidAction] = {}
+
+    def score(self, member: discord.Member, skeleton: str) -> int:
+        score = 0
+
+        age = discord.utils.utcnow() - member.created_at
+        if age < self.new_account_age:
+            score += 1
+            if age < datetime.timedelta(days=1):
+                score += 1
+
+        if member.avatar is None:
+            score += 1
+
+        # several recent joiners with the same name skeleton
+        score += min(self._names[skeleton], 2)
+        return score
+
+    def _evict(self, now: float):
+        for window in self.windows:
+            cutoff = now - window.seconds
+            events = window.events
+            while events and events[0].timestamp <= cutoff:
+                event = events.popleft()
+                if event.score >= self.min_score:
+                    window.suspicious -= 1
+
+                if window is self._longest:
+                    self._names[event.skeleton] -= 1
+                    if not self._names[event.skeleton]:
+                        del self._names[event.skeleton]
+                    self._actioned.pop(event.member.id, None)
+
+    def pressure(self, now: Optional[float] = None) -> float:
+        """Highest ratio of suspicious joins to threshold across the windows."""
+        self._evict(time.monotonic() if now is None else now)
+        return max(w.pressure for w in self.windows)
+
+    def _level_for(self, pressure: float) -> RaidAction:
+        level = RaidAction.NONE
+        for action, needed in zip(list(RaidAction)[1:], self.escalation):
+            if pressure >= needed:
+                level = action
+        return level
+
+    def observe(
+        self, member: discord.Member, now: Optional[float] = None
+    ) -> List[Tuple[discord.Member, RaidAction]]:
+        """Record a join, returns the members to act on and what to do with them."""
+        now = time.monotonic() if now is None else now
+        self._evict(now)
+
+        skeleton = name_skeleton(member.name)
+        event = JoinEvent(member, now, skeleton, self.score(member, skeleton))
+        suspicious = event.score >= self.min_score
+
+        for window in self.windows:
+            window.events.append(event)
+            if suspicious:
+                window.suspicious += 1
+        self._names[skeleton] += 1
+
+        level = self._level_for(max(w.pressure for w in self.windows))
+        if level > self.level:
+            # escalating, also catch up on everyone who joined earlier in the raid
+            targets = [e for e in self._longest.events if e.score >= self.min_score]
+        elif level and suspicious:
+            targets = [event]
+        else:
+            targets = []
+        self.level = level
+
+        actions = []
+        for e in targets:
+            if self._actioned.get(e.member.id, RaidAction.NONE) < level:
+                self._actioned[e.member.id] = level
+                actions.append((e.member, level))
+        return actions
+
+    def is_flagged(self, member_id: int) -> bool:
+        return member_id in self._actioned
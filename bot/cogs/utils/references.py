@@ -0,0 +1,59 @@
+"""Resolving the message a command replies to.
+
+Replies usually carry the referenced message already, or it's in the
+library's message cache. Older messages are fetched once and kept in a
+small LRU, with concurrent lookups of the same message sharing a single
+request. The cleaned text of a message is computed once per message
+version and shared by every command.
+"""
+
+from typing import Callable, Optional
+
+import discord
+from discord.ext import commands
+
+from bot.cogs.utils.cache import CoalescingCache, LRUCache
+
+
+class ReferenceResolver:
+    def __init__(
+        self,
+        clean: Callable[[str], str],
+        *,
+        maxsize: int = 256,
+        ttl: Optional[float] = 15 * 60,
+    ):
+        self._clean = clean
+        # message id -> fetched message
+        self.fetched = CoalescingCache(maxsize, ttl)
+        # (message id, edited_at) -> cleaned content
+        self.cleaned = LRUCache(maxsize * 4)
+
+    async def resolve(self, ctx: commands.Context) -> Optional[discord.Message]:
+        """The message ``ctx`` replies to, or None if there's none or it's gone."""
+        ref = ctx.message.reference
+        if ref is None or ref.message_id is None:
+            return None
+
+        if isinstance(ref.resolved, discord.Message):
+            return ref.resolved
+        if ref.cached_message is not None:
+            return ref.cached_message
+
+        channel = ctx.bot.get_channel(ref.channel_id) or ctx.channel
+
+        async def fetch():
+            return await channel.fetch_message(ref.message_id)
+
+        try:
+            return await self.fetched.get_or_compute(ref.message_id, fetch)
+        except (discord.NotFound, discord.Forbidden):
+            return None
+
+    def clean(self, message: discord.Message) -> str:
+        key = (message.id, message.edited_at)
+        cleaned = self.cleaned.get(key)
+        if cleaned is None:
+            cleaned = self._clean(message.content)
+            self.cleaned.set(key, cleaned)
+        return cleaned
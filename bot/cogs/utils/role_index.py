@@ -0,0 +1,93 @@
+"""Per guild index of role names.
+
+Kept up to date from role events, so checking whether a name is taken is
+a dict lookup instead of a scan over every role of the guild. Names are
+casefolded, "Cool Kid" and "cool kid" are the same name.
+"""
+
+from typing import Dict, Optional, Set
+
+import discord
+
+# roles a guild can have, and how many of them stay free for staff
+ROLE_LIMIT = 250
+RESERVED_SLOTS = 10
+
+
+def name_key(name: str) -> str:
+    return name.casefold()
+
+
+class GuildRoles:
+    __slots__ = ("by_name", "names")
+
+    def __init__(self):
+        # casefolded name -> ids of the roles with that name
+        self.by_name: Dict[str, Set[int]] = {}
+        # role id -> its casefolded name
+        self.names: Dict[int, str] = {}
+
+
+class RoleNameIndex:
+    def __init__(self):
+        self._guilds: Dict[int, GuildRoles] = {}
+
+    def build(self, guild: discord.Guild) -> GuildRoles:
+        index = self._guilds[guild.id] = GuildRoles()
+        for role in guild.roles:
+            self._add(index, role.id, role.name)
+        return index
+
+    def _get(self, guild: discord.Guild) -> GuildRoles:
+        index = self._guilds.get(guild.id)
+        # built on first use, kept current by the role events afterwards
+        return index if index is not None else self.build(guild)
+
+    def _add(self, index: GuildRoles, role_id: int, name: str):
+        key = name_key(name)
+        index.names[role_id] = key
+        index.by_name.setdefault(key, set()).add(role_id)
+
+    def _remove(self, index: GuildRoles, role_id: int):
+        key = index.names.pop(role_id, None)
+        if key is None:
+            return
+        ids = index.by_name[key]
+        ids.discard(role_id)
+        if not ids:
+            del index.by_name[key]
+
+    def add(self, role: discord.Role):
+        index = self._guilds.get(role.guild.id)
+        if index is not None:
+            self._add(index, role.id, role.name)
+
+    def remove(self, role: discord.Role):
+        index = self._guilds.get(role.guild.id)
+        if index is not None:
+            self._remove(index, role.id)
+
+    def update(self, before: discord.Role, after: discord.Role):
+        index = self._guilds.get(after.guild.id)
+        if index is not None and before.name != after.name:
+            self._remove(index, before.id)
+            self._add(index, after.id, after.name)
+
+    def forget(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+
+    def is_taken(
+        self, guild: discord.Guild, name: str, *, exclude: Optional[int] = None
+    ) -> bool:
+        """Whether a role other than ``exclude`` already has this name."""
+        ids = self._get(guild).by_name.get(name_key(name))
+        if not ids:
+            return False
+        return len(ids) > 1 or exclude not in ids
+
+    def count(self, guild: discord.Guild) -> int:
+        return len(self._get(guild).names)
+
+    def slots(self, guild: discord.Guild) -> int:
+        """Roles that can still be created, leaving the reserved ones free."""
+        return ROLE_LIMIT - RESERVED_SLOTS - self.count(guild)
@@ -0,0 +1,67 @@
+"""Write-through cache of custom role documents.
+
+Every document is loaded once when the cog loads and kept in memory by
+user id and role id, so looking up someone's custom role or the owner of
+a role doesn't touch the database. Writes go to MongoDB first and only
+change the cache once they succeeded.
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+
+class CustomRoleStore:
+    def __init__(self, collection):
+        self.collection = collection
+        # user id -> their document
+        self._by_user: Dict[int, Dict[str, Any]] = {}
+        # role id -> user id
+        self._by_role: Dict[int, int] = {}
+
+    async def load(self):
+        self._by_user.clear()
+        self._by_role.clear()
+        async for document in self.collection.find({}):
+            user_id = document["user_id"]
+            if user_id in self._by_user:
+                log.warning("User %s has more than one custom role document", user_id)
+                continue
+            self._cache(document)
+
+    def _cache(self, document: Dict[str, Any]):
+        self._by_user[document["user_id"]] = document
+        self._by_role[document["role_id"]] = document["user_id"]
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """The custom role document of a user, don't modify it."""
+        return self._by_user.get(user_id)
+
+    async def insert(self, document: Dict[str, Any]):
+        await self.collection.insert_one(document)
+        self._cache(document)
+
+    async def update(self, user_id: int, fields: Dict[str, Any]):
+        document = self._by_user.get(user_id)
+        if document is None:
+            return
+        await self.collection.update_one(
+            {"user_id": user_id, "role_id": document["role_id"]}, {"$set": fields}
+        )
+        document.update(fields)
+
+    async def delete(self, user_id: int):
+        await self.collection.delete_many({"user_id": user_id})
+        document = self._by_user.pop(user_id, None)
+        if document is not None:
+            self._by_role.pop(document["role_id"], None)
+
+    async def delete_role(self, role_id: int):
+        """Drop the document of a role that no longer exists."""
+        user_id = self._by_role.get(role_id)
+        if user_id is not None:
+            await self.delete(user_id)
+
+    def __len__(self):
+        return len(self._by_user)
@@ -0,0 +1,195 @@
+"""Shared budget for calls to a rate limited API.
+
+Every call needs a slot: a concurrency permit, one request from a
+per-minute request bucket and its estimated tokens from a per-minute
+token bucket. Calls that can't start right away wait in a priority queue,
+lower priority values first and in arrival order within a priority, and
+are told their position so the caller can let the user know.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from bot.exceptions import CompletionQueueFull
+
+
+class TokenBucket:
+    """``per_minute`` tokens, refilled continuously, bursting up to a minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: Optional[float] = None) -> float:
+        """Seconds until ``amount`` tokens are available, 0 if they are now."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        # more than the capacity would never fit, a full bucket has to do
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float):
+        # may go negative, e.g. when a call used more than it was estimated at
+        self.tokens -= amount
+
+
+class Ticket:
+    __slots__ = ("priority", "seq", "tokens", "used", "future")
+
+    def __init__(self, priority: int, seq: int, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        # estimated cost, set ``used`` to the real one once it's known
+        self.tokens = tokens
+        self.used: Optional[int] = None
+        self.future = future
+
+    def __lt__(self, other: "Ticket"):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class CallScheduler:
+    def __init__(
+        self,
+        *,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrent: int,
+        max_queue: int = 50,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+
+        self._queue: List[Ticket] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # metrics
+        self.started = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return sum(1 for t in self._queue if not t.future.done())
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place of ``ticket`` among the waiting calls."""
+        return 1 + sum(1 for t in self._queue if t < ticket and not t.future.done())
+
+    def _can_start(self, ticket: Ticket) -> float:
+        """0 if ``ticket`` can start now, otherwise seconds to wait, or -1 for a release."""
+        if self._active >= self.max_concurrent:
+            return -1
+        now = time.monotonic()
+        return max(
+            self.requests.wait_time(1, now), self.tokens.wait_time(ticket.tokens, now)
+        )
+
+    def _start(self, ticket: Ticket):
+        self._active += 1
+        self.started += 1
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+
+    def _release(self, ticket: Ticket):
+        self._active -= 1
+        if ticket.used is not None:
+            # settle the estimate against what it really cost
+            self.tokens.take(ticket.used - ticket.tokens)
+        self._wakeup.set()
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self,
+        *,
+        priority: int = 0,
+        tokens: int = 0,
+        on_queued: Optional[Callable[[int], Awaitable]] = None,
+    ) -> AsyncIterator[Ticket]:
+        """Wait for the budget to allow a call of about ``tokens`` tokens.
+
+        ``on_queued(position)`` is awaited if the call has to wait.
+        """
+        loop = asyncio.get_running_loop()
+        ticket = Ticket(priority, next(self._seq), tokens, loop.create_future())
+
+        if not len(self) and self._can_start(ticket) == 0:
+            self._start(ticket)
+        else:
+            if len(self) >= self.max_queue:
+                self.rejected += 1
+                raise CompletionQueueFull("Too many queued calls")
+
+            self.queued += 1
+            heapq.heappush(self._queue, ticket)
+            self._wakeup.set()
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._run())
+
+            try:
+                if on_queued is not None:
+                    await on_queued(self.position(ticket))
+                await ticket.future
+            except BaseException:
+                if not ticket.future.done():
+                    ticket.future.cancel()
+                elif not ticket.future.cancelled():
+                    # started just as the caller gave up, hand the slot back
+                    self._release(ticket)
+                raise
+
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            delay = None
+            while self._queue:
+                ticket = self._queue[0]
+                if ticket.future.done():
+                    heapq.heappop(self._queue)
+                    continue
+
+                wait = self._can_start(ticket)
+                if wait:
+                    delay = wait if wait > 0 else None
+                    break
+
+                heapq.heappop(self._queue)
+                self._start(ticket)
+                ticket.future.set_result(None)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        for ticket in self._queue:
+            if not ticket.future.done():
+                ticket.future.cancel()
+        self._queue.clear()
@@ -0,0 +1,93 @@
+"""Constant memory per-minute event counters.
+
+Each metric is an ``array`` with one slot per minute of the retention
+period, used as a ring buffer. A shared array of minute stamps tells
+whether a slot still belongs to the current lap or is stale, so old
+minutes are reset lazily when their slot is reused. Arrays serialize to
+compact bytes for persistence.
+"""
+
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(values: List[int]) -> str:
+    if not values:
+        return ""
+    top = max(values)
+    if not top:
+        return SPARK_CHARS[0] * len(values)
+    scale = len(SPARK_CHARS) - 1
+    return "".join(SPARK_CHARS[round(v / top * scale)] for v in values)
+
+
+class MinuteCounters:
+    """Per-minute counts of a few metrics over the last ``size`` minutes."""
+
+    def __init__(self, metrics: Iterable[str], size: int = 7 * 24 * 60):
+        self.size = size
+        self.stamps = array("q", [-1]) * size
+        self.counts: Dict[str, array] = {m: array("I", [0]) * size for m in metrics}
+
+    def _slot(self, minute: int) -> int:
+        index = minute % self.size
+        if self.stamps[index] != minute:
+            # slot is from a previous lap, start it over
+            self.stamps[index] = minute
+            for counts in self.counts.values():
+                counts[index] = 0
+        return index
+
+    def incr(self, metric: str, amount: int = 1, now: Optional[float] = None):
+        minute = int((time.time() if now is None else now) // 60)
+        self.counts[metric][self._slot(minute)] += amount
+
+    def series(
+        self, metric: str, minutes: int, now: Optional[float] = None
+    ) -> List[int]:
+        """Counts of the last ``minutes`` minutes, oldest first."""
+        current = int((time.time() if now is None else now) // 60)
+        counts = self.counts[metric]
+        stamps = self.stamps
+
+        values = []
+        for minute in range(current - min(minutes, self.size) + 1, current + 1):
+            index = minute % self.size
+            values.append(counts[index] if stamps[index] == minute else 0)
+        return values
+
+    def buckets(
+        self, metric: str, bucket_minutes: int, count: int, now: Optional[float] = None
+    ) -> List[int]:
+        """Sums over ``count`` buckets of ``bucket_minutes`` minutes, oldest first."""
+        values = self.series(metric, bucket_minutes * count, now)
+        return [
+            sum(values[i : i + bucket_minutes])
+            for i in range(0, len(values), bucket_minutes)
+        ]
+
+    # persistence
+
+    def to_document(self) -> dict:
+        doc = {"size": self.size, "stamps": self.stamps.tobytes()}
+        doc.update({m: c.tobytes() for m, c in self.counts.items()})
+        return doc
+
+    def load_document(self, doc: dict):
+        if doc.get("size") != self.size:
+            return  # retention changed, start over
+
+        stamps = array("q")
+        stamps.frombytes(doc["stamps"])
+        self.stamps = stamps
+
+        for metric in self.counts:
+            counts = array("I")
+            if metric in doc:
+                counts.frombytes(doc[metric])
+            else:
+                counts = array("I", [0]) * self.size
+            self.counts[metric] = counts
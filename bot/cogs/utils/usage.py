@@ -0,0 +1,141 @@
+"""Token and latency accounting for completion calls.
+
+Calls are counted in memory per command and per user, and the counters
+are added to MongoDB with ``$inc`` updates in one bulk write per flush,
+so recording a call never waits on the database.
+"""
+
+import logging
+from typing import Any, Dict, List
+
+from discord.ext import tasks
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+log = logging.getLogger(__name__)
+
+
+class UsageStats:
+    __slots__ = (
+        "calls",
+        "cache_hits",
+        "prompt_tokens",
+        "completion_tokens",
+        "latency",
+        "max_latency",
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # seconds, summed over the calls
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, prompt_tokens, completion_tokens, latency, cached):
+        self.calls += 1
+        self.cache_hits += cached
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def merge(self, other: "UsageStats"):
+        self.calls += other.calls
+        self.cache_hits += other.cache_hits
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.latency += other.latency
+        self.max_latency = max(self.max_latency, other.max_latency)
+
+    def to_update(self) -> Dict[str, Any]:
+        return {
+            "$inc": {
+                "calls": self.calls,
+                "cache_hits": self.cache_hits,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "tokens": self.prompt_tokens + self.completion_tokens,
+                "latency": self.latency,
+            },
+            "$max": {"max_latency": self.max_latency},
+        }
+
+
+class UsageTracker:
+    """Per command and per user completion counters, flushed periodically."""
+
+    def __init__(self, collection, *, flush_interval: float = 60.0):
+        self.collection = collection
+        # (kind, name) -> counters since the last flush
+        self._pending: Dict[tuple, UsageStats] = {}
+        self.flusher.change_interval(seconds=flush_interval)
+
+    def record(
+        self,
+        command: str,
+        user_id: int,
+        *,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency: float = 0.0,
+        cached: bool = False,
+    ):
+        for key in (("command", command), ("user", user_id)):
+            stats = self._pending.get(key)
+            if stats is None:
+                stats = self._pending[key] = UsageStats()
+            stats.add(prompt_tokens, completion_tokens, latency, cached)
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        requests = []
+        for kind, name in keys:
+            update = pending[kind, name].to_update()
+            update["$set"] = {"kind": kind, "name": name}
+            requests.append(UpdateOne({"_id": f"{kind}:{name}"}, update, upsert=True))
+
+        try:
+            await self.collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # the other updates were applied, only these would be counted once
+            failed = [
+                keys[error["index"]] for error in e.details.get("writeErrors", [])
+            ]
+            self._merge_back(pending, failed)
+            log.warning("Failed to write %s usage counters: %s", len(failed), e)
+        except Exception as e:
+            self._merge_back(pending, keys)
+            log.warning("Failed to write %s usage counters: %s", len(requests), e)
+
+    def _merge_back(self, pending: Dict[tuple, UsageStats], keys: List[tuple]):
+        # they'll go out with the next flush
+        for key in keys:
+            stats = pending[key]
+            current = self._pending.get(key)
+            if current is not None:
+                stats.merge(current)
+            self._pending[key] = stats
+
+    @tasks.loop(seconds=60)
+    async def flusher(self):
+        await self.flush()
+
+    async def top(self, kind: str, *, limit: int = 10) -> List[Dict[str, Any]]:
+        """Stored counters of a kind, most tokens first."""
+        return (
+            await self.collection.find({"kind": kind})
+            .sort("tokens", DESCENDING)
+            .limit(limit)
+            .to_list(None)
+        )
+
+    async def close(self):
+        self.flusher.cancel()
+        await self.flush()
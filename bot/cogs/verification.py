@@ -1,11 +1,36 @@
 import asyncio
+import datetime
+import functools
+import io
+import logging
 import random
 import string
+import time
 
 import discord
 from discord.ext import commands
 
-from bot.constants import Categories, Guilds, Roles
+from bot.cogs.utils.attachments import AttachmentKind, classify, has_kind
+from bot.cogs.utils.dashboard import LiveMessage
+from bot.cogs.utils.deadlines import DeadlineScheduler
+from bot.cogs.utils.dispatch import MessageFlags
+from bot.cogs.utils.images import review_copy
+from bot.cogs.utils.queues import WorkQueue
+from bot.constants import (
+    Categories,
+    Channels,
+    Guilds,
+    Images,
+    Roles,
+    VerificationConfig,
+)
+
+log = logging.getLogger(__name__)
+
+# channels without an upload are removed after this many seconds
+VERIFICATION_TIMEOUT = 30 * 60
+# entries listed on the queue dashboard, the embed description is limited
+DASHBOARD_ROWS = 30
 
 
 def is_mod(member):
@@ -18,20 +43,9 @@ def get_random_code():
     )
 
 
-async def remove_channel_after(
-    duration: int, member: discord.Member, channel: discord.TextChannel
+async def create_verification_channel(
+    member: discord.Member, verification_type: str, cog: "Verification"
 ):
-    await asyncio.sleep(duration)
-    if channel and member:
-        last_20_msgs = [
-            m async for m in channel.history(limit=20) if m.author == member
-        ]
-        # check if the user has sent any attachments in the last 20 messages
-        if not any(m.attachments for m in last_20_msgs):
-            await channel.delete(reason="Verification channel expired")
-
-
-async def create_verification_channel(member: discord.Member, verification_type: str):
     cat = member.guild.get_channel(Categories.verification)
 
     mod_role = member.guild.get_role(Roles.mod)
@@ -100,121 +114,366 @@ async def create_verification_channel(member: discord.Member, verification_type:
     _msg = await priv_channel.send(
         embed=embed,
         content=member.mention,
-        view=VerificationView(member, verification_type),
+        view=VerificationView(member.id, verification_type),
     )
     await _msg.add_reaction("🗑️")
 
-    await remove_channel_after(30 * 60, member, priv_channel)
+    await cog.add_to_queue(priv_channel, member, verification_type)
     return priv_channel
 
 
-class VerificationView(discord.ui.View):
-    def __init__(self, member: discord.Member, verification_type: str):
-        super().__init__(timeout=None)
-        self.value = None
-        self.member = member
+VERIFICATION_TYPES = {
+    "selfie": ("Selfie verification", discord.ButtonStyle.green),
+    "art": ("Art verification", discord.ButtonStyle.blurple),
+}
+
+
+class VerificationButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r"verification:(?P<action>approve|reject):(?P<type>selfie|art):(?P<member_id>[0-9]+)",
+):
+    """Approve or reject button, the member and type live in the custom id."""
+
+    def __init__(self, action: str, verification_type: str, member_id: int):
+        approve = action == "approve"
+        super().__init__(
+            discord.ui.Button(
+                label="Approve" if approve else "Reject",
+                style=discord.ButtonStyle.green if approve else discord.ButtonStyle.red,
+                custom_id=f"verification:{action}:{verification_type}:{member_id}",
+            )
+        )
+        self.action = action
         self.verification_type = verification_type
+        self.member_id = member_id
 
-    @discord.ui.button(label="Approve", style=discord.ButtonStyle.green)
-    async def approve(
-        self, interaction: discord.Interaction, button: discord.ui.Button
-    ):
-        if not is_mod(interaction.user):
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["action"], match["type"], int(match["member_id"]))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return is_mod(interaction.user)
+
+    async def callback(self, interaction: discord.Interaction):
+        member = interaction.guild.get_member(self.member_id)
+        if member is None:
+            await interaction.response.send_message(
+                "This member has left the server", ephemeral=True
+            )
+            await interaction.channel.delete(reason="Member left during verification")
+            return
+
+        if self.action == "reject":
+            await interaction.response.send_message(
+                f"Rejecting {member.display_name}'s submission", ephemeral=True
+            )
+            await interaction.channel.delete(reason=f"Verfication failed")
+            await member.send(f"We couldn't verify your submission")
             return
 
         await interaction.response.send_message(
-            f"Verifying {self.member.display_name}", ephemeral=True
+            f"Verifying {member.display_name}", ephemeral=True
         )
         role_id = Roles.verified if self.verification_type == "selfie" else Roles.artist
 
         role = interaction.guild.get_role(role_id)
 
-        await self.member.add_roles(role)
-
-        self.value = True
-        self.stop()
+        await member.add_roles(role)
 
         await interaction.channel.delete(reason=f"Verfication successful")
-        await self.member.send(f"We have verified your submission 🥳")
+        await member.send(f"We have verified your submission 🥳")
+
 
-    @discord.ui.button(label="Reject", style=discord.ButtonStyle.red)
-    async def reject(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if not is_mod(interaction.user):
+class VerificationTypeButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r"verification:start:(?P<type>selfie|art)",
+):
+    """Starts a selfie or art verification for whoever clicks it."""
+
+    def __init__(self, verification_type: str, *, disabled: bool = False):
+        label, style = VERIFICATION_TYPES[verification_type]
+        super().__init__(
+            discord.ui.Button(
+                label=label,
+                style=style,
+                disabled=disabled,
+                custom_id=f"verification:start:{verification_type}",
+            )
+        )
+        self.verification_type = verification_type
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["type"])
+
+    async def callback(self, interaction: discord.Interaction):
+        role_id = Roles.verified if self.verification_type == "selfie" else Roles.artist
+        role = interaction.guild.get_role(role_id)
+        if role in interaction.user.roles:
+            await interaction.response.send_message(
+                f"You already have the {role.name} role", ephemeral=True
+            )
             return
 
-        await interaction.response.send_message(
-            f"Rejecting {self.member.display_name}'s submission", ephemeral=True
+        # creating the channel can take longer than the interaction allows
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        try:
+            await interaction.message.edit(view=VerificationTypeView(disabled=True))
+        except discord.HTTPException:
+            pass  # the prompt deletes itself after a while
+
+        cog = interaction.client.get_cog("Verification")
+        channel = await create_verification_channel(
+            interaction.user, self.verification_type, cog
+        )
+        await interaction.followup.send(
+            f"Please follow your recent ping in {channel.mention}", ephemeral=True
         )
-        self.value = False
-        self.stop()
 
-        await interaction.channel.delete(reason=f"Verfication failed")
-        await self.member.send(f"We couldn't verify your submission")
+
+class VerificationView(discord.ui.View):
+    """Review buttons of a verification channel.
+
+    Only holds dynamic items, so nothing is kept per message and the
+    buttons keep working after a restart.
+    """
+
+    def __init__(self, member_id: int, verification_type: str):
+        super().__init__(timeout=None)
+        self.add_item(VerificationButton("approve", verification_type, member_id))
+        self.add_item(VerificationButton("reject", verification_type, member_id))
 
 
 class VerificationTypeView(discord.ui.View):
     """View for choosing verification type (selfie or artwork)"""
 
-    def __init__(self):
+    def __init__(self, *, disabled: bool = False):
         super().__init__(timeout=None)
+        for verification_type in VERIFICATION_TYPES:
+            self.add_item(VerificationTypeButton(verification_type, disabled=disabled))
 
-    @discord.ui.button(label="Selfie verification", style=discord.ButtonStyle.green)
-    async def selfie(self, interaction: discord.Interaction, button: discord.ui.Button):
 
-        verified_role = interaction.guild.get_role(Roles.verified)
-        if verified_role in interaction.user.roles:
-            await interaction.response.send_message(
-                f"You already have the {verified_role.name} role", ephemeral=True
-            )
-        else:
-            channel = await create_verification_channel(interaction.user, "selfie")
-            await interaction.response.send_message(
-                f"Please follow your recent ping in {channel.mention}", ephemeral=True
+class Verification(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        # verification channels still waiting for an upload, by channel id
+        self.expiry = DeadlineScheduler(bot.verification_deadlines, self.expire_channel)
+        # submissions are replaced in the background, keyed by message.
+        # reposting isn't idempotent, so failures aren't retried
+        self.submissions = WorkQueue(
+            "verification_submissions", workers=Images.workers, retries=0
+        )
+        # ids of the channels in the verification category
+        self.channels = set()
+        # pending verifications by channel id, also stored in the database
+        self.queue = {}
+        self.dashboard = LiveMessage(
+            bot,
+            "verification_queue",
+            Channels.staff_room,
+            self.render_queue,
+            interval=VerificationConfig.dashboard_interval,
+        )
+
+        bot.dispatcher.register(
+            self.on_verification_upload,
+            guild_id=Guilds.cc,
+            flags=MessageFlags.ATTACHMENTS,
+        )
+
+    async def cog_load(self):
+        # routes clicks on every verification message, however old
+        self.bot.add_dynamic_items(VerificationButton, VerificationTypeButton)
+        await self.expiry.load()
+        self.expiry.start()
+
+        async for doc in self.bot.verification_queue.find():
+            self.queue[doc.pop("_id")] = doc
+        await self.dashboard.load()
+        self.dashboard.refresher.start()
+        # on_ready has already fired when the cog is reloaded, and
+        # extensions load before the bot connects, so don't wait here
+        self.channel_sync = asyncio.create_task(self.sync_channels_when_ready())
+
+    async def cog_unload(self):
+        self.bot.remove_dynamic_items(VerificationButton, VerificationTypeButton)
+        self.bot.dispatcher.unregister(self)
+        self.expiry.stop()
+        self.dashboard.refresher.cancel()
+        self.channel_sync.cancel()
+        await self.submissions.stop()
+
+    async def add_to_queue(
+        self, channel: discord.TextChannel, member: discord.Member, verification_type
+    ):
+        entry = {
+            "member_id": member.id,
+            "type": verification_type,
+            "created_at": datetime.datetime.utcnow(),
+            "uploaded": False,
+        }
+        self.queue[channel.id] = entry
+        self.dashboard.invalidate()
+        await self.bot.verification_queue.insert_one({"_id": channel.id, **entry})
+
+        # removed by the expiry scheduler unless the member uploads something
+        await self.expiry.schedule(
+            channel.id, time.time() + VERIFICATION_TIMEOUT, member_id=member.id
+        )
+
+    async def remove_from_queue(self, channel_id: int):
+        if self.queue.pop(channel_id, None) is None:
+            return
+        self.dashboard.invalidate()
+        await self.bot.verification_queue.delete_one({"_id": channel_id})
+
+    def render_queue(self) -> discord.Embed:
+        entries = sorted(self.queue.items(), key=lambda e: e[1]["created_at"])
+        uploaded = sum(1 for _, e in entries if e["uploaded"])
+
+        lines = []
+        for channel_id, entry in entries[:DASHBOARD_ROWS]:
+            created_at = entry["created_at"].replace(tzinfo=datetime.timezone.utc)
+            status = "📷 ready for review" if entry["uploaded"] else "⏳ no upload yet"
+            # relative timestamps keep counting up without edits
+            lines.append(
+                f"<#{channel_id}> {entry['type']} · <@{entry['member_id']}> · "
+                f"{discord.utils.format_dt(created_at, 'R')} · {status}"
             )
+        if len(entries) > DASHBOARD_ROWS:
+            lines.append(f"... and {len(entries) - DASHBOARD_ROWS} more")
 
-        for item in self.children:
-            item.disabled = True
-        await self.stop()
-        await interaction.response.edit_message(view=self)
+        embed = discord.Embed(
+            title="Verification queue",
+            description="\n".join(lines) or "Nothing to review 🎉",
+            color=discord.Color.red(),
+        )
+        embed.set_footer(
+            text=f"{len(entries)} pending, {uploaded} ready for review · last updated"
+        )
+        embed.timestamp = discord.utils.utcnow()
+        return embed
+
+    async def expire_channel(self, channel_id: int, data: dict):
+        # deadlines loaded at startup may fire before the cache is filled
+        await self.bot.wait_until_ready()
+        channel = self.bot.get_channel(channel_id)
+        if channel is not None:
+            await channel.delete(reason="Verification channel expired")
 
-    @discord.ui.button(label="Art verification", style=discord.ButtonStyle.blurple)
-    async def art(self, interaction: discord.Interaction, button: discord.ui.Button):
+    async def on_verification_upload(self, msg: discord.Message, info):
+        if msg.channel.id not in self.channels:
+            return
 
-        art_role = interaction.guild.get_role(Roles.artist)
-        if art_role in interaction.user.roles:
-            await interaction.response.send_message(
-                f"You already have the {art_role.name} role", ephemeral=True
+        # the member uploaded their picture, the channel stays until reviewed
+        entry = self.queue.get(msg.channel.id)
+        if (
+            entry is not None
+            and entry["member_id"] == msg.author.id
+            and has_kind(msg, AttachmentKind.IMAGE)
+        ):
+            await self.expiry.cancel(msg.channel.id)
+            if not entry["uploaded"]:
+                entry["uploaded"] = True
+                self.dashboard.invalidate()
+                await self.bot.verification_queue.update_one(
+                    {"_id": msg.channel.id}, {"$set": {"uploaded": True}}
+                )
+
+        if not is_mod(msg.author) and has_kind(msg, AttachmentKind.IMAGE):
+            # downloading and re-encoding is slow, keep it off the dispatch path
+            self.submissions.submit(
+                msg.id, functools.partial(self.replace_submission, msg)
             )
 
-        else:
-            channel = await create_verification_channel(interaction.user, "art")
-            await interaction.response.send_message(
-                f"Please follow your recent ping in {channel.mention}", ephemeral=True
+    async def replace_submission(self, msg: discord.Message):
+        """Repost the pictures as stripped, downscaled copies and delete the original."""
+        # deleting the original loses whatever isn't reposted, so only replace
+        # messages that are nothing but pictures we can copy
+        if msg.content or msg.stickers:
+            return
+
+        files = []
+        for attachment in msg.attachments:
+            if not classify(attachment).is_image or attachment.size > Images.max_bytes:
+                return
+            try:
+                data = await attachment.read()
+                copy = await self.bot.run_in_process(
+                    review_copy, data, Images.review_size
+                )
+            except Exception as e:
+                log.warning("Failed to process submission %s: %s", attachment.id, e)
+                return
+            files.append(discord.File(io.BytesIO(copy), f"submission_{len(files)}.jpg"))
+
+        if not files:
+            return
+
+        embeds = []
+        for file in files:
+            embed = discord.Embed(color=discord.Color.red())
+            embed.set_author(
+                name=f"Submission of {msg.author}",
+                icon_url=msg.author.display_avatar.url,
             )
+            embed.set_image(url=f"attachment://{file.filename}")
+            embeds.append(embed)
 
-        for item in self.children:
-            item.disabled = True
+        await msg.channel.send(embeds=embeds, files=files)
+        try:
+            await msg.delete()
+        except discord.NotFound:
+            pass
 
-        await self.stop()
-        await interaction.response.edit_message(view=self)
+    async def sync_channels_when_ready(self):
+        await self.bot.wait_until_ready()
+        await self.sync_channels()
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # also after reconnects, channel events may have been missed meanwhile
+        await self.sync_channels()
 
-class Verification(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
+    async def sync_channels(self):
+        category = self.bot.get_channel(Categories.verification)
+        if category is not None:
+            self.channels = {c.id for c in category.channels}
+
+            # forget verifications whose channel was deleted while offline
+            for channel_id in self.queue.keys() - self.channels:
+                await self.remove_from_queue(channel_id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        if channel.category_id == Categories.verification:
+            self.channels.add(channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        if after.category_id == Categories.verification:
+            self.channels.add(after.id)
+        else:
+            self.channels.discard(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.channels.discard(channel.id)
+        if channel.id in self.expiry:
+            await self.expiry.cancel(channel.id)
+        await self.remove_from_queue(channel.id)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
-        if payload.user_id == self.bot.user.id:
+        # every reaction in the guild lands here, most aren't ours
+        if payload.channel_id not in self.channels:
             return
-
-        channel = self.bot.get_channel(payload.channel_id)
-        if channel is None:
+        if payload.user_id == self.bot.user.id or payload.emoji.name != "🗑️":
             return
 
-        if channel.category.id == Categories.verification:
-            if is_mod(payload.member) and payload.emoji.name == "🗑️":
-                await channel.delete(reason="Verification couldn't be completed")
+        channel = self.bot.get_channel(payload.channel_id)
+        if channel is not None and is_mod(payload.member):
+            await channel.delete(reason="Verification couldn't be completed")
 
     @commands.command(hidden=True)
     @commands.cooldown(1, 60, commands.BucketType.member)
@@ -234,7 +493,7 @@ class Verification(commands.Cog):
         """Removes a verification channel directly"""
         if ctx.guild.id != Guilds.cc:
             return
-        if ctx.channel.category.id != Categories.verification:
+        if ctx.channel.id not in self.channels:
             return
 
         await ctx.channel.delete(reason="Interaction test failed")
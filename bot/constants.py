@@ -283,6 +283,85 @@ class Keys(metaclass=YAMLGetter):
     openai_key: str
 
 
+class OpenAIConfig(metaclass=YAMLGetter):
+    section = "openai"
+
+    base_url: str
+    model: str
+    timeout: int
+    retries: int
+    cache_size: int
+    cache_ttl: int
+    stream_edit_interval: float
+    requests_per_minute: int
+    tokens_per_minute: int
+    max_concurrent: int
+    max_queue: int
+    usage_flush_interval: int
+
+
+class Icons(metaclass=YAMLGetter):
+    section = "icons"
+
+    max_download: int
+    size: int
+    timeout: int
+    cache_size: int
+    cache_ttl: int
+
+
+class Cooldowns(metaclass=YAMLGetter):
+    section = "cooldowns"
+
+    capacity: int
+    sweep_interval: int
+    wheel_slots: int
+    snapshot: bool
+    snapshot_interval: int
+
+
+class ModLogConfig(metaclass=YAMLGetter):
+    section = "modlog"
+
+    batch_size: int
+    flush_interval: int
+    max_pending: int
+    retention_days: int
+
+
+class Raids(metaclass=YAMLGetter):
+    section = "raids"
+
+    enabled: bool
+    windows: List[Dict[str, int]]
+    min_score: int
+    new_account_days: int
+    escalation: List[float]
+    quarantine_minutes: int
+
+
+class Welcomes(metaclass=YAMLGetter):
+    section = "welcomes"
+
+    enabled: bool
+    max_members: int
+    edit_window: int
+
+
+class VerificationConfig(metaclass=YAMLGetter):
+    section = "verification"
+
+    dashboard_interval: int
+
+
+class Images(metaclass=YAMLGetter):
+    section = "images"
+
+    workers: int
+    review_size: int
+    max_bytes: int
+
+
 # Paths
 BOT_DIR = os.path.dirname(__file__)
 PROJECT_ROOT = os.path.abspath(os.path.join(BOT_DIR, os.pardir))
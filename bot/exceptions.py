@@ -7,3 +7,15 @@ class SnippetDoesNotExist(CommandError):
 
 class SnippetExists(CommandError):
     pass
+
+
+class CompletionFailed(CommandError):
+    pass
+
+
+class CompletionQueueFull(CompletionFailed):
+    pass
+
+
+class IconUnavailable(CommandError):
+    pass
@@ -0,0 +1,253 @@
+"""Latency benchmark for the OpenAI cog against the local mock server.
+
+Starts the mock completions endpoint, loads the cog with a stand-in bot
+and drives its commands through fake contexts, bypassing checks and
+cooldowns. Reports per-command latency percentiles and how late the event
+loop ran a 10ms ticker while requests were in flight:
+
+    python -m scripts.bench_openai --requests 200 --concurrency 20 --latency 0.8
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from typing import Dict, List
+
+# constants.py requires a token, the benchmark never logs in
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+
+import aiohttp
+from aiohttp import web
+
+from bot.cogs.openai import OpenAI
+from bot.cogs.utils.cache import CoalescingCache
+from bot.cogs.utils.completions import CompletionClient
+from bot.cogs.utils.formats import TabularData
+from bot.cogs.utils.scheduler import CallScheduler
+from bot.constants import Roles
+from scripts.mock_openai import add_arguments, create_app, settings_from_args
+
+COMMANDS = ("fact", "topic", "english", "ask", "story", "explain")
+LAG_INTERVAL = 0.01
+
+
+class FakeGuild:
+    id = 0
+
+    def get_role(self, role_id):
+        return role_id
+
+
+class FakeMember:
+    def __init__(self, member_id: int, mod: bool = False):
+        self.id = member_id
+        self.display_name = f"member{member_id}"
+        self.guild = FakeGuild()
+        self.roles = [Roles.mod] if mod else []
+
+
+class FakeMessage:
+    def __init__(self, content: str = "", author=None, reference=None):
+        self.id = random.getrandbits(63)
+        self.edited_at = None
+        self.content = content
+        self.author = author
+        self.reference = reference
+        self.edits = 0
+
+    async def edit(self, *, content=None, **kwargs):
+        self.content = content
+        self.edits += 1
+
+    async def delete(self):
+        pass
+
+    def to_reference(self):
+        return self
+
+
+class FakeReference:
+    def __init__(self, message: FakeMessage):
+        self.message_id = message.id
+        self.channel_id = 0
+        self.resolved = None
+        self.cached_message = message
+
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    def typing(self):
+        return FakeTyping()
+
+
+class FakeContext:
+    def __init__(self, author: FakeMember, referenced: FakeMessage = None):
+        self.author = author
+        self.guild = author.guild
+        self.channel = FakeChannel()
+        self.message = FakeMessage(
+            "!cmd",
+            author,
+            FakeReference(referenced) if referenced is not None else None,
+        )
+        self.sent: List[FakeMessage] = []
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(content or "", None)
+        self.sent.append(message)
+        return message
+
+    reply = send
+
+
+async def run_command(cog: OpenAI, name: str, ctx: FakeContext, i: int, unique: int):
+    topic = f"subject {i % unique}"
+    command = getattr(cog, name)
+    if name == "fact":
+        await command.callback(cog, ctx, topic=topic)
+    elif name == "topic":
+        await command.callback(cog, ctx, category=topic)
+    elif name == "ask":
+        await command.callback(cog, ctx, question=f"what is {topic}?")
+    elif name == "story":
+        await command.callback(cog, ctx, members=f"alice bob {topic}")
+    else:
+        await command.callback(cog, ctx)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def watch_lag(samples: List[float], stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(loop.time() - started - LAG_INTERVAL)
+
+
+async def benchmark(args):
+    settings = settings_from_args(args)
+    runner = web.AppRunner(create_app(settings))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    session = aiohttp.ClientSession()
+    # usage counters stay in memory, nothing is flushed
+    bot = type("Bot", (), {"session": session, "ai_usage": None})()
+
+    cog = OpenAI(bot)
+    cog.client = CompletionClient(
+        bot, "benchmark", base_url=f"http://127.0.0.1:{args.port}/v1"
+    )
+    cog.cache = CoalescingCache(args.cache_size, ttl=None)
+    cog.scheduler = CallScheduler(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_concurrent=args.concurrency,
+        max_queue=args.requests,
+    )
+
+    commands = args.commands.split(",")
+    latencies: Dict[str, List[float]] = {c: [] for c in commands}
+    failures: Dict[str, int] = {c: 0 for c in commands}
+    edits: Dict[str, int] = {c: 0 for c in commands}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int):
+        name = commands[i % len(commands)]
+        author = FakeMember(i % 50, mod=random.random() < args.mod_share)
+        referenced = FakeMessage(
+            f"this are a sentense number {i % args.unique}", author
+        )
+        ctx = FakeContext(author, referenced)
+        ctx.command = getattr(cog, name)
+
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await run_command(cog, name, ctx, i, args.unique)
+            except Exception:
+                failures[name] += 1
+                return
+            latencies[name].append(time.perf_counter() - started)
+            edits[name] += sum(m.edits for m in ctx.sent)
+
+    lag: List[float] = []
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_lag(lag, stop))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await watcher
+    cog.scheduler.stop()
+    await session.close()
+    await runner.cleanup()
+
+    table = TabularData()
+    table.set_columns(["Command", "Runs", "Failed", "p50 (ms)", "p99 (ms)", "Edits"])
+    for name in commands:
+        values = latencies[name]
+        table.add_row(
+            [
+                name,
+                len(values),
+                failures[name],
+                f"{percentile(values, 50) * 1000:.0f}",
+                f"{percentile(values, 99) * 1000:.0f}",
+                edits[name],
+            ]
+        )
+    print(table.render())
+
+    print(
+        f"\n{args.requests} commands in {elapsed:.1f}s, "
+        f"{settings.requests} upstream requests ({settings.errors} errors), "
+        f"cache hit ratio {cog.cache.hit_ratio:.0%}"
+    )
+    print(
+        "event loop lag: "
+        f"p50 {percentile(lag, 50) * 1000:.1f}ms, "
+        f"p99 {percentile(lag, 99) * 1000:.1f}ms, "
+        f"max {max(lag, default=0) * 1000:.1f}ms, "
+        f"mean {statistics.fmean(lag) * 1000 if lag else 0:.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--commands", default=",".join(COMMANDS))
+    # distinct prompts per command, fewer means more cache hits
+    parser.add_argument("--unique", type=int, default=1_000_000)
+    parser.add_argument("--cache-size", type=int, default=512)
+    parser.add_argument("--mod-share", type=float, default=0.1)
+    parser.add_argument("--rpm", type=int, default=100_000)
+    parser.add_argument("--tpm", type=int, default=100_000_000)
+    parser.add_argument("--port", type=int, default=8801)
+    add_arguments(parser)
+    asyncio.run(benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
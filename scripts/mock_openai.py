@@ -0,0 +1,129 @@
+"""Local stand-in for the OpenAI completions endpoint.
+
+Answers ``POST /v1/completions`` with filler text after a configurable
+delay, optionally streamed as server-sent events and with a share of
+rate limit or server errors, so the OpenAI cog can be exercised without
+a key. Run it standalone and point ``openai.base_url`` at it:
+
+    python -m scripts.mock_openai --port 8800 --latency 0.8 --error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while chill corner members "
+    "share art selfies and stories about cats coffee and rainy days"
+).split()
+
+
+class MockSettings:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.5,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        tokens_per_second: float = 50.0,
+    ):
+        # seconds before the first byte, +- jitter
+        self.latency = latency
+        self.jitter = jitter
+        # share of requests answered with a 429 or 503
+        self.error_rate = error_rate
+        # pace of streamed tokens
+        self.tokens_per_second = tokens_per_second
+
+        self.requests = 0
+        self.errors = 0
+
+
+def filler(tokens: int):
+    return [f" {random.choice(WORDS)}" for _ in range(tokens)]
+
+
+async def completions(request: web.Request) -> web.StreamResponse:
+    settings: MockSettings = request.app["settings"]
+    settings.requests += 1
+    body = await request.json()
+
+    delay = settings.latency + random.uniform(-settings.jitter, settings.jitter)
+    await asyncio.sleep(max(delay, 0))
+
+    if random.random() < settings.error_rate:
+        settings.errors += 1
+        status = random.choice((429, 503))
+        return web.json_response(
+            {"error": {"message": "mock failure"}},
+            status=status,
+            headers={"Retry-After": "0.1"} if status == 429 else None,
+        )
+
+    # generate somewhere between half and all of the allowed tokens
+    max_tokens = body.get("max_tokens", 16)
+    tokens = filler(random.randint(max(max_tokens // 2, 1), max(max_tokens, 1)))
+    prompt_tokens = len(body.get("prompt", "")) // 4
+
+    if not body.get("stream"):
+        return web.json_response(
+            {
+                "id": f"cmpl-mock-{settings.requests}",
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"text": "".join(tokens), "index": 0}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                },
+            }
+        )
+
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await resp.prepare(request)
+    for token in tokens:
+        chunk = {"choices": [{"text": token, "index": 0}], "model": body.get("model")}
+        await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await asyncio.sleep(1 / settings.tokens_per_second)
+    await resp.write(b"data: [DONE]\n\n")
+    await resp.write_eof()
+    return resp
+
+
+def create_app(settings: MockSettings) -> web.Application:
+    app = web.Application()
+    app["settings"] = settings
+    app.router.add_post("/v1/completions", completions)
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+
+
+def settings_from_args(args) -> MockSettings:
+    return MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        tokens_per_second=args.tokens_per_second,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    web.run_app(create_app(settings_from_args(args)), host=args.host, port=args.port)